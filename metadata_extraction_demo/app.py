@@ -1,13 +1,44 @@
+import csv
+import json
 import logging
-from difflib import Differ
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from pathlib import Path
 
 import gradio as gr
 from gradio_pdf import PDF
 
-from metadata_extraction_demo.constants import DIRECTORY_PATH, DOCLING_BASE_URL
-from metadata_extraction_demo.convert import build_document_converter, convert_pdf_to_text
+from metadata_extraction_demo.cache import conversion_cache, response_cache
+from metadata_extraction_demo.constants import (
+    CONVERSION_PROFILE,
+    CONVERTER_WARMUP_METHODS,
+    DEFAULT_CONCURRENCY,
+    DIFF_CONCURRENCY,
+    DIRECTORY_PATH,
+    DOCLING_BASE_URL,
+    FILE_CONCURRENCY,
+    LLM_CONCURRENCY,
+    OCR_CONCURRENCY,
+    QUEUE_MAX_SIZE,
+    VLM_PAGES_PER_CONVERSION,
+)
+from metadata_extraction_demo.convert import (
+    CONVERSION_PROFILES,
+    PDF_EXTENSIONS,
+    SUPPORTED_EXTENSIONS,
+    convert_pdf_to_text,
+    converter_key,
+    converter_options,
+    converter_pool,
+    get_document_converter,
+)
+from metadata_extraction_demo.diff import diff_texts, error_rates
 from metadata_extraction_demo.pipeline import MetadataExtractionPipeline
-from metadata_extraction_demo.utils import build_model_from_yaml, get_models, has_ocrmac
+from metadata_extraction_demo.pruning import prune_text
+from metadata_extraction_demo.telemetry import start_metrics_server
+from metadata_extraction_demo.utils import ModelCatalog, build_model_from_yaml, has_ocrmac
 
 logfile = DIRECTORY_PATH / "logfile.txt"
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
@@ -16,45 +47,243 @@ logger = logging.getLogger(__name__)
 INSTRUCTIONS = (DIRECTORY_PATH / "Instructions.md").read_text().strip()
 DEFAULT_METADATA = (DIRECTORY_PATH / "metadata.yaml").read_text().strip()
 DEFAULT_PDF_PATH = str(DIRECTORY_PATH / "Sample_Contract.pdf")
-DEFAULT_MODELS = get_models()
+MODEL_CATALOG = ModelCatalog()
+MODEL_CATALOG.refresh_in_background()
 AVAILABLE_OCR_METHODS = ["EasyOCR"]
 AVAILABLE_OCR_METHODS += ["OCRMac"] if has_ocrmac() else []
 AVAILABLE_OCR_METHODS += ["Server"] if DOCLING_BASE_URL is not None else []
 AVAILABLE_OCR_METHODS += ["VLM"]
+WARMUP_METHODS = [method for method in CONVERTER_WARMUP_METHODS if method in map(str.lower, AVAILABLE_OCR_METHODS)]
+threading.Thread(target=converter_pool.warm_up, args=(WARMUP_METHODS,), daemon=True).start()
+# Conversions of every event share these slots, including the files converted concurrently by Extract All
+OCR_SLOTS = threading.BoundedSemaphore(OCR_CONCURRENCY)
 
 
-def process_pdf(pdf_file, llm_name: str, method: str, system_prompt: str, force_full_page_ocr: str, yaml_string: str):
-    """Process the PDF."""
-    method_ = method.lower()
-    converter = build_document_converter(method=method_, force_full_page_ocr=force_full_page_ocr)
+def build_pipeline(
+    path: str,
+    llm_name: str,
+    method: str,
+    system_prompt: str,
+    force_full_page_ocr: str,
+    yaml_string: str,
+    selective_ocr: str = "No",
+    profile: str = CONVERSION_PROFILE,
+) -> MetadataExtractionPipeline:
+    """Build the extraction pipeline for a file and the configured options."""
+    options = converter_options(
+        path,
+        method=method.lower(),
+        force_full_page_ocr=force_full_page_ocr == "Yes",
+        selective_ocr=selective_ocr == "Yes",
+        profile=profile.lower(),
+    )
+    converter = get_document_converter(**options)
     response_format = build_model_from_yaml(yaml_string)
-    pipe = MetadataExtractionPipeline(converter=converter, model=llm_name, response_format=response_format, system_prompt=system_prompt)
-    metadata, pdf_text = pipe.extract(pdf_file)
-    return metadata.model_dump_json(indent=2), pdf_text
+    pipe = MetadataExtractionPipeline(
+        converter=converter,
+        model=llm_name,
+        response_format=response_format,
+        system_prompt=system_prompt,
+        conversion_cache=conversion_cache,
+        cache_namespace=converter_key(**options),
+        response_cache=response_cache,
+        # Convert several pages per VLM call to save the per-call overhead of the pipeline
+        pages_per_conversion=VLM_PAGES_PER_CONVERSION if options["method"] == "vlm" else 1,
+    )
+    return pipe
+
+
+def convert_pdf(
+    pdf_file, llm_name: str, method: str, system_prompt: str, force_full_page_ocr: str, yaml_string: str, selective_ocr: str, profile: str
+):
+    """Convert the document to text, streaming the text page by page."""
+    pipe = build_pipeline(pdf_file, llm_name, method, system_prompt, force_full_page_ocr, yaml_string, selective_ocr, profile)
+    pages = []
+    with OCR_SLOTS:
+        for page_text in pipe.iter_path_to_pages(pdf_file):
+            pages.append(page_text)
+            yield "", "\n\n".join(pages), pages
+
+
+def extract_metadata(pages: list[str], llm_name: str, system_prompt: str, yaml_string: str, extraction_mode: str):
+    """Extract metadata from the converted pages, streaming the metadata as it is generated."""
+    # The pages are already converted, so the pipeline only needs the LLM side and never loads a converter
+    pipe = MetadataExtractionPipeline(
+        converter=None,
+        model=llm_name,
+        response_format=build_model_from_yaml(yaml_string),
+        system_prompt=system_prompt,
+        response_cache=response_cache,
+    )
+    pdf_text = "\n\n".join(pages)
+    if extraction_mode == "Chunked":
+        metadata = pipe.chunked_pages_to_metadata(pages)
+        yield metadata.model_dump_json(indent=2)
+    elif extraction_mode == "Relevant Sections":
+        pruned_text, pruning_stats = prune_text(pdf_text, response_format=pipe.response_format)
+        logger.info(f"Context pruning saved {pruning_stats['tokens_saved']} estimated tokens")
+        yield from pipe.stream_text_to_metadata(pruned_text)
+    else:
+        yield from pipe.stream_text_to_metadata(pdf_text)
+
+
+def extract_file(
+    path: str,
+    row: list,
+    llm_name: str,
+    method: str,
+    system_prompt: str,
+    force_full_page_ocr: str,
+    yaml_string: str,
+    extraction_mode: str,
+    selective_ocr: str,
+    profile: str,
+) -> dict:
+    """Convert a file and extract its metadata, updating the status of its progress row as it goes."""
+    start = time.perf_counter()
+    record = {"path": Path(path).name, "metadata": None, "error": None}
+    try:
+        # Only the conversion takes an OCR slot, so other files can convert while this one waits for the LLM
+        with OCR_SLOTS:
+            row[1] = "converting"
+            pipe = build_pipeline(path, llm_name, method, system_prompt, force_full_page_ocr, yaml_string, selective_ocr, profile)
+            document = pipe.path_to_document(path)
+        row[1] = "extracting"
+        if extraction_mode == "Chunked":
+            metadata = pipe.chunked_document_to_metadata(document)
+        elif extraction_mode == "Relevant Sections":
+            pruned_text, _ = prune_text(document.export_to_markdown(), response_format=pipe.response_format)
+            metadata = pipe.text_to_metadata(pruned_text)
+        else:
+            metadata = pipe.text_to_metadata(document.export_to_markdown())
+        record["metadata"] = metadata.model_dump(mode="json")
+        row[1] = "done"
+    except Exception as e:
+        logger.exception(f"Failed to process {path}")
+        record["error"] = repr(e)
+        row[1], row[3] = "failed", repr(e)
+    row[2] = round(time.perf_counter() - start, 1)
+    return record
+
+
+def write_results(records: list[dict]) -> list[str]:
+    """Write the extracted metadata of each file to a combined JSONL and CSV file, returning their paths."""
+    directory = Path(tempfile.mkdtemp(prefix="metadata_"))
+    jsonl_path, csv_path = directory / "metadata.jsonl", directory / "metadata.csv"
+    with open(jsonl_path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+    # One column per top-level field, nested values are kept as JSON
+    fields = list(dict.fromkeys(field for record in records for field in record["metadata"] or {}))
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["path", *fields, "error"])
+        writer.writeheader()
+        for record in records:
+            metadata = {
+                field: json.dumps(value) if isinstance(value, (dict, list)) else value
+                for field, value in (record["metadata"] or {}).items()
+            }
+            writer.writerow({"path": record["path"], **metadata, "error": record["error"]})
+    return [str(jsonl_path), str(csv_path)]
+
+
+def extract_all(
+    files: list[str],
+    llm_name: str,
+    method: str,
+    system_prompt: str,
+    force_full_page_ocr: str,
+    yaml_string: str,
+    extraction_mode: str,
+    selective_ocr: str,
+    profile: str,
+):
+    """Extract metadata from every uploaded file concurrently, streaming a progress table and finishing with the combined results."""
+    files = files or []
+    progress = [[Path(path).name, "queued", None, ""] for path in files]
+    yield progress, None
+
+    options = (llm_name, method, system_prompt, force_full_page_ocr, yaml_string, extraction_mode, selective_ocr, profile)
+    with ThreadPoolExecutor(max_workers=FILE_CONCURRENCY) as executor:
+        futures = [executor.submit(extract_file, path, row, *options) for path, row in zip(files, progress)]
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+            yield [row.copy() for row in progress], None
+
+    yield progress, write_results([future.result() for future in futures])
+
+
+def select_document(files: list[str], selected: str = None):
+    """List the uploaded files in the document dropdown, keeping the current selection if it is still uploaded."""
+    files = files or []
+    value = selected if selected in files else (files[0] if files else None)
+    return gr.Dropdown(choices=[(Path(path).name, path) for path in files], value=value)
 
 
 def compare_ocr_methods(pdf_file, method_1: str, method_2: str, force_full_page_ocr_1: str, force_full_page_ocr_2: str):
-    """Compare two ocr methods."""
+    """Compare two ocr methods, showing the text of each method as soon as its conversion finishes."""
     logger.info("Converting PDF to text")
-    pdf_text_1 = convert_pdf_to_text(pdf_path=pdf_file, method=method_1.lower(), force_full_page_ocr=force_full_page_ocr_1 == "Yes")
-    pdf_text_2 = convert_pdf_to_text(pdf_path=pdf_file, method=method_2.lower(), force_full_page_ocr=force_full_page_ocr_2 == "Yes")
-    return pdf_text_1, pdf_text_2, gr.HighlightedText(visible=False)
+    options = [(method_1.lower(), force_full_page_ocr_1 == "Yes"), (method_2.lower(), force_full_page_ocr_2 == "Yes")]
+    pdf_texts = ["", ""]
+    yield *pdf_texts, gr.HighlightedText(visible=False)
+
+    # Run both conversions concurrently, converting only once if both sides use the same options
+    with OCR_SLOTS, ThreadPoolExecutor(max_workers=2) as executor:
+        futures = {}
+        for method, force_full_page_ocr in options:
+            if (method, force_full_page_ocr) not in futures:
+                futures[(method, force_full_page_ocr)] = executor.submit(
+                    convert_pdf_to_text, pdf_path=pdf_file, method=method, force_full_page_ocr=force_full_page_ocr
+                )
+        for future in as_completed(futures.values()):
+            pdf_text = future.result()
+            for side, option in enumerate(options):
+                if futures[option] is future:
+                    pdf_texts[side] = pdf_text
+            yield *pdf_texts, gr.HighlightedText(visible=False)
 
 
 def make_diffs(pdf_text_1: str, pdf_text_2: str):
     """Create a view of diffs between two strings."""
     logger.info("Making diffs")
-    d = Differ()
-    diffs_12 = [(token[2:], token[0] if token[0] != " " else None) for token in d.compare(pdf_text_1, pdf_text_2)]
+    diffs_12 = diff_texts(pdf_text_1, pdf_text_2)
+    rates = error_rates(pdf_text_1, pdf_text_2)
     highlighted_text_12 = gr.HighlightedText(
-        value=diffs_12, label="Diff", combine_adjacent=True, show_legend=True, color_map={"+": "blue", "-": "green"}, visible=True
+        value=diffs_12,
+        label=f"Diff (character error rate {rates['cer']:.1%}, word error rate {rates['wer']:.1%})",
+        combine_adjacent=True,
+        show_legend=True,
+        color_map={"+": "blue", "-": "green"},
+        visible=True,
     )
     return highlighted_text_12
 
 
+def load_models(selected_model: str = None):
+    """Load the available models into the model dropdown."""
+    models = MODEL_CATALOG.get(wait=MODEL_CATALOG.timeout)
+    value = selected_model if selected_model in models else (models[0] if models else None)
+    return gr.Dropdown(choices=models, value=value)
+
+
+def refresh_models(selected_model: str = None):
+    """Refetch the available models."""
+    MODEL_CATALOG.refresh()
+    return load_models(selected_model)
+
+
+def clear_cached_responses(selected_model: str):
+    """Invalidate the cached LLM responses of a model, e.g. after it was updated behind the same name."""
+    response_cache.invalidate(model=selected_model)
+    gr.Info(f"Cleared the cached responses of {selected_model}")
+
+
 def view_pdf(pdf_file):
-    """View the PDF."""
-    return PDF(value=pdf_file)
+    """View the PDF, or nothing if the document is in another format."""
+    is_pdf = pdf_file is not None and Path(pdf_file).suffix.lower() in PDF_EXTENSIONS
+    return PDF(value=pdf_file if is_pdf else None)
 
 
 theme = gr.themes.Base(
@@ -63,18 +292,36 @@ theme = gr.themes.Base(
 
 with gr.Blocks(theme=theme) as demo:
     gr.Markdown("# Metadata Extraction Demo")
-    gr.Markdown("Extract structured data from a PDF using AI.")
+    gr.Markdown("Extract structured data from documents using AI.")
     with gr.Tab("Instructions"):
         gr.Markdown(INSTRUCTIONS)
-    with gr.Tab("Upload PDF"):
+    with gr.Tab("Upload Documents"):
         with gr.Column():
-            pdf_file = gr.File(label="Upload PDF", file_types=[".pdf"], file_count="single", value=DEFAULT_PDF_PATH)
+            uploaded_files = gr.File(
+                label="Upload Documents", file_types=SUPPORTED_EXTENSIONS, file_count="multiple", value=[DEFAULT_PDF_PATH]
+            )
+            pdf_file = gr.Dropdown(
+                label="Selected Document",
+                choices=[(Path(DEFAULT_PDF_PATH).name, DEFAULT_PDF_PATH)],
+                value=DEFAULT_PDF_PATH,
+                interactive=True,
+            )
             pdf_viewer = PDF(label="PDF Preview", value=DEFAULT_PDF_PATH)
     with gr.Tab("Configuration"):
         with gr.Row():
-            llm = gr.Dropdown(label="Extraction Model", choices=DEFAULT_MODELS, interactive=True)
+            with gr.Column():
+                llm = gr.Dropdown(label="Extraction Model", choices=[], interactive=True)
+                refresh_models_button = gr.Button("Refresh Models", variant="secondary", size="sm")
+                clear_cache_button = gr.Button("Clear Cached Responses", variant="secondary", size="sm", visible=response_cache is not None)
             ocr_method = gr.Radio(label="OCR Method", choices=AVAILABLE_OCR_METHODS, value="EasyOCR", interactive=True)
             force_full_page_ocr = gr.Radio(label="Force Full Page OCR?", choices=["Yes", "No"], value="No")
+            selective_ocr = gr.Radio(label="Skip OCR for Pages with Text?", choices=["Yes", "No"], value="No")
+            conversion_profile = gr.Radio(
+                label="Conversion Profile", choices=[profile.title() for profile in CONVERSION_PROFILES], value=CONVERSION_PROFILE.title()
+            )
+            extraction_mode = gr.Radio(
+                label="Extraction Mode", choices=["Whole Document", "Chunked", "Relevant Sections"], value="Whole Document"
+            )
         with gr.Row(equal_height=True):
             metadata_structure = gr.Code(
                 label="Metadata Structure",
@@ -89,6 +336,13 @@ with gr.Blocks(theme=theme) as demo:
         with gr.Row(equal_height=True):
             extracted_text = gr.Markdown(label="Extracted Text", show_label=True, container=True, max_height=750, show_copy_button=True)
             extracted_metadata = gr.Code(label="Extracted Metadata", language="json", wrap_lines=True)
+        converted_pages = gr.State([])
+    with gr.Tab("Extract All Documents"):
+        extract_all_button = gr.Button("Extract Metadata from All Documents", variant="primary")
+        extraction_progress = gr.Dataframe(
+            headers=["File", "Status", "Seconds", "Error"], datatype=["str", "str", "number", "str"], interactive=False, wrap=True
+        )
+        extraction_results = gr.File(label="Extracted Metadata (JSONL and CSV)", file_count="multiple", interactive=False)
 
     with gr.Tab("Compare OCR Methods"):
         with gr.Row(equal_height=True):
@@ -114,21 +368,58 @@ with gr.Blocks(theme=theme) as demo:
         with gr.Row():
             differences = gr.HighlightedText(visible=False)
 
+    demo.load(fn=load_models, inputs=[llm], outputs=[llm])
+    refresh_models_button.click(fn=refresh_models, inputs=[llm], outputs=[llm])
+    clear_cache_button.click(fn=clear_cached_responses, inputs=[llm])
+    uploaded_files.change(fn=select_document, inputs=[uploaded_files, pdf_file], outputs=[pdf_file])
     pdf_file.change(fn=view_pdf, inputs=[pdf_file], outputs=[pdf_viewer])
+    # OCR and LLM work run as separate events, so each waits in its own concurrency pool
     extract_button.click(
-        fn=process_pdf,
-        inputs=[pdf_file, llm, ocr_method, system_prompt, force_full_page_ocr, metadata_structure],
-        outputs=[extracted_metadata, extracted_text],
+        fn=convert_pdf,
+        inputs=[pdf_file, llm, ocr_method, system_prompt, force_full_page_ocr, metadata_structure, selective_ocr, conversion_profile],
+        outputs=[extracted_metadata, extracted_text, converted_pages],
+        concurrency_id="ocr",
+        concurrency_limit=OCR_CONCURRENCY,
+    ).success(
+        fn=extract_metadata,
+        inputs=[converted_pages, llm, system_prompt, metadata_structure, extraction_mode],
+        outputs=[extracted_metadata],
+        concurrency_id="llm",
+        concurrency_limit=LLM_CONCURRENCY,
+    )
+    extract_all_button.click(
+        fn=extract_all,
+        inputs=[
+            uploaded_files,
+            llm,
+            ocr_method,
+            system_prompt,
+            force_full_page_ocr,
+            metadata_structure,
+            extraction_mode,
+            selective_ocr,
+            conversion_profile,
+        ],
+        outputs=[extraction_progress, extraction_results],
+        # Conversions wait for OCR slots inside the event, so it must not hold a slot of the OCR pool itself
+        concurrency_id="extract_all",
+        concurrency_limit=1,
     )
     compare_ocr_button.click(
         fn=compare_ocr_methods,
         inputs=[pdf_file, ocr_method_1, ocr_method_2, force_full_page_ocr_1, force_full_page_ocr_2],
         outputs=[extracted_text_1, extracted_text_2, differences],
+        concurrency_id="ocr",
+        concurrency_limit=OCR_CONCURRENCY,
     )
     show_diffs_button.click(
         fn=make_diffs,
         inputs=[extracted_text_1, extracted_text_2],
         outputs=[differences],
+        concurrency_id="diff",
+        concurrency_limit=DIFF_CONCURRENCY,
     )
 
+start_metrics_server()
+demo.queue(max_size=QUEUE_MAX_SIZE, default_concurrency_limit=DEFAULT_CONCURRENCY)
 demo.launch()
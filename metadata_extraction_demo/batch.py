@@ -0,0 +1,173 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from pydantic import BaseModel
+
+from metadata_extraction_demo.cache import response_cache
+from metadata_extraction_demo.constants import BATCH_CONVERSION_WORKERS, BATCH_LLM_CONCURRENCY, CONVERSION_PROFILE, DIRECTORY_PATH
+from metadata_extraction_demo.convert import CONVERSION_PROFILES, SUPPORTED_EXTENSIONS, convert_pdf_to_text
+from metadata_extraction_demo.pipeline import MetadataExtractionPipeline
+from metadata_extraction_demo.telemetry import start_metrics_server
+from metadata_extraction_demo.utils import build_model_from_yaml
+
+logger = logging.getLogger(__name__)
+
+
+def collect_paths(source: str, pattern: str = "*") -> list[Path]:
+    """Collect the files to process from a directory, keeping supported formats, or a manifest with one path per line."""
+    source = Path(source)
+    if source.is_dir():
+        return sorted(path for path in source.rglob(pattern) if path.suffix.lower() in SUPPORTED_EXTENSIONS)
+    lines = [line.strip() for line in source.read_text().splitlines()]
+    return [Path(line) for line in lines if line and not line.startswith("#")]
+
+
+def load_finished(output_path: Path) -> set[str]:
+    """Get the paths that already have a successful result in the output file."""
+    finished = set()
+    if not output_path.exists():
+        return finished
+    with open(output_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Partially written line from an interrupted run
+                continue
+            if record.get("error") is None:
+                finished.add(record["path"])
+    return finished
+
+
+async def extract_batch(
+    paths: list[Path],
+    output_path: Path,
+    model: str,
+    response_format: BaseModel,
+    method: str = "easyocr",
+    force_full_page_ocr: bool = False,
+    selective_ocr: bool = False,
+    profile: str = CONVERSION_PROFILE,
+    system_prompt: str = None,
+    conversion_workers: int = BATCH_CONVERSION_WORKERS,
+    llm_concurrency: int = BATCH_LLM_CONCURRENCY,
+    resume: bool = True,
+) -> dict:
+    """
+    Extract metadata from many files, streaming one JSON line per file to the output as results complete.
+
+    Conversion runs in a process pool and LLM calls run on the async client, each under its own concurrency limit.
+
+    Args:
+    ----
+        paths (list[Path]): Files to process.
+        output_path (Path): JSONL file to append results to.
+        model (str): Name of the LLM used for extraction.
+        response_format (BaseModel): Pydantic model describing the metadata to extract.
+        method (str): Conversion method.
+        force_full_page_ocr (bool): Whether to force full page OCR.
+        selective_ocr (bool): Whether to only OCR pages without a usable text layer.
+        profile (str): Conversion profile.
+        system_prompt (str): Optional system prompt.
+        conversion_workers (int): Number of conversion processes.
+        llm_concurrency (int): Maximum number of concurrent LLM requests.
+        resume (bool): Skip files that already have a successful result in the output file.
+
+    Returns:
+    -------
+        dict: Counts of succeeded, failed and skipped files.
+
+    """
+    output_path = Path(output_path)
+    finished = load_finished(output_path) if resume else set()
+    todo = [path for path in paths if str(path) not in finished]
+    counts = {"succeeded": 0, "failed": 0, "skipped": len(paths) - len(todo)}
+    logger.info(f"Processing {len(todo)} files, skipping {counts['skipped']} already finished")
+
+    # Conversion happens in the worker processes, so the pipeline only needs the LLM side
+    pipe = MetadataExtractionPipeline(
+        converter=None, model=model, response_format=response_format, system_prompt=system_prompt, response_cache=response_cache
+    )
+    llm_semaphore = asyncio.Semaphore(llm_concurrency)
+    # Bound the files in flight, so conversions are not all queued at once and converted texts don't pile up waiting for the LLM
+    in_flight = asyncio.Semaphore(conversion_workers + llm_concurrency)
+    loop = asyncio.get_running_loop()
+
+    async def process(path: Path, executor: ProcessPoolExecutor) -> dict:
+        record = {"path": str(path), "metadata": None, "error": None}
+        try:
+            text = await loop.run_in_executor(executor, convert_pdf_to_text, str(path), method, force_full_page_ocr, selective_ocr, profile)
+            async with llm_semaphore:
+                metadata = await pipe.atext_to_metadata(text=text)
+            record["metadata"] = metadata.model_dump(mode="json")
+        except Exception as e:
+            logger.exception(f"Failed to process {path}")
+            record["error"] = repr(e)
+        return record
+
+    async def bounded_process(path: Path, executor: ProcessPoolExecutor) -> dict:
+        async with in_flight:
+            return await process(path, executor)
+
+    # Spawn workers so they don't inherit model or client state from the parent
+    mp_context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=conversion_workers, mp_context=mp_context) as executor, open(output_path, "a") as f:
+        tasks = [asyncio.create_task(bounded_process(path, executor)) for path in todo]
+        for task in asyncio.as_completed(tasks):
+            record = await task
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            counts["failed" if record["error"] else "succeeded"] += 1
+
+    return counts
+
+
+def main():
+    """Run batch metadata extraction from the command line."""
+    parser = argparse.ArgumentParser(description="Extract metadata from a directory or manifest of documents.")
+    parser.add_argument("source", help="Directory to search for documents, or a manifest file with one path per line.")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file to write results to.")
+    parser.add_argument("-m", "--model", required=True, help="Extraction model.")
+    parser.add_argument("--schema", default=str(DIRECTORY_PATH / "metadata.yaml"), help="YAML metadata structure.")
+    parser.add_argument("--method", default="easyocr", choices=["easyocr", "ocrmac", "server", "vlm"], help="Conversion method.")
+    parser.add_argument("--force-full-page-ocr", action="store_true", help="Force full page OCR.")
+    parser.add_argument("--selective-ocr", action="store_true", help="Only OCR pages without a usable text layer.")
+    parser.add_argument("--profile", default=CONVERSION_PROFILE, choices=list(CONVERSION_PROFILES), help="Conversion profile.")
+    parser.add_argument("--system-prompt", default=None, help="Optional system prompt.")
+    parser.add_argument("--pattern", default="*", help="Glob pattern used when the source is a directory.")
+    parser.add_argument("--conversion-workers", type=int, default=BATCH_CONVERSION_WORKERS, help="Number of conversion processes.")
+    parser.add_argument("--llm-concurrency", type=int, default=BATCH_LLM_CONCURRENCY, help="Maximum concurrent LLM requests.")
+    parser.add_argument("--no-resume", action="store_true", help="Reprocess files that already have results in the output.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+    start_metrics_server()
+    response_format = build_model_from_yaml(Path(args.schema).read_text())
+    counts = asyncio.run(
+        extract_batch(
+            paths=collect_paths(args.source, args.pattern),
+            output_path=Path(args.output),
+            model=args.model,
+            response_format=response_format,
+            method=args.method,
+            force_full_page_ocr=args.force_full_page_ocr,
+            selective_ocr=args.selective_ocr,
+            profile=args.profile,
+            system_prompt=args.system_prompt,
+            conversion_workers=args.conversion_workers,
+            llm_concurrency=args.llm_concurrency,
+            resume=not args.no_resume,
+        )
+    )
+    logger.info(f"Finished batch: {counts}")
+    if response_cache is not None:
+        logger.info(f"Response cache: {response_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
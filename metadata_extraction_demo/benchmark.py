@@ -0,0 +1,240 @@
+import argparse
+import io
+import itertools
+import json
+import logging
+import math
+import multiprocessing
+import resource
+import statistics
+import sys
+import threading
+import time
+from base64 import b64decode
+from concurrent.futures import ProcessPoolExecutor
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from PyPDF2 import PdfReader
+
+from metadata_extraction_demo.constants import CONVERSION_PROFILE, DIRECTORY_PATH, DOCLING_API_KEY, DOCLING_BASE_URL
+from metadata_extraction_demo.convert import CONVERSION_PROFILES
+from metadata_extraction_demo.diff import error_rates
+from metadata_extraction_demo.utils import has_ocrmac
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CORPUS = [DIRECTORY_PATH / "Sample_Contract.pdf"]
+
+
+class StubDoclingHandler(BaseHTTPRequestHandler):
+    """Minimal docling-serve stand-in that returns the PDF text layer as doctags."""
+
+    latency = 0.0
+
+    def do_POST(self):  # noqa: N802
+        """Handle a conversion request."""
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        pdf = PdfReader(io.BytesIO(b64decode(body["file_sources"][0]["base64_string"])))
+        pages = [f"<text><loc_0><loc_0><loc_500><loc_500>{escape(page.extract_text() or '')}</text>" for page in pdf.pages]
+        time.sleep(self.latency * len(pages))
+
+        response = json.dumps(
+            {"status": "success", "errors": [], "document": {"doctags_content": "<doctag>" + "<page_break>".join(pages) + "</doctag>"}}
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(response.encode())
+
+    def log_message(self, format, *args):
+        """Silence per-request logging."""
+
+
+def start_stub_server(latency: float = 0.0) -> ThreadingHTTPServer:
+    """Start a stub Docling server on a free local port."""
+    handler = type("Handler", (StubDoclingHandler,), {"latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def peak_rss_mb() -> float:
+    """Get the peak resident set size of the current process in MB."""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return max_rss / 1024**2 if sys.platform == "darwin" else max_rss / 1024
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Get the nearest-rank percentile of a list of values."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+def run_case(pdf_path: str, method: str, force_full_page_ocr: bool, server_url: str = None, profile: str = CONVERSION_PROFILE) -> dict:
+    """Convert a PDF page by page with a freshly built converter and measure it. Meant to run in its own process."""
+    from metadata_extraction_demo.convert import build_document_converter, build_local_docling_converter, get_conversion_profile
+
+    start = time.perf_counter()
+    if method == "server":
+        from metadata_extraction_demo.docling_server import DoclingServerConverter
+
+        settings = get_conversion_profile(profile)
+        addtl_ocr_options = {
+            "force_ocr": force_full_page_ocr,
+            "image_export_mode": "placeholder",
+            "do_table_structure": settings["do_table_structure"],
+            "table_mode": settings["table_mode"],
+        }
+        converter = DoclingServerConverter(base_url=server_url, api_key=DOCLING_API_KEY, addtl_ocr_options=addtl_ocr_options)
+    else:
+        from docling.datamodel.base_models import InputFormat
+
+        if method == "vlm":
+            # Load the VLM in this process rather than in a VLM_WORKER_PROCESS worker, so its memory counts towards peak_rss_mb
+            converter = build_local_docling_converter(ocr_engine="vlm", profile=profile)
+        else:
+            converter = build_document_converter(method=method, force_full_page_ocr=force_full_page_ocr, profile=profile)
+        # Docling loads model weights on the first conversion, so load them now to keep them out of the page latencies
+        converter.initialize_pipeline(InputFormat.PDF)
+    build_seconds = time.perf_counter() - start
+
+    with open(pdf_path, "rb") as f:
+        num_pages = len(PdfReader(f).pages)
+    page_seconds = []
+    page_texts = []
+    for page_no in range(1, num_pages + 1):
+        start = time.perf_counter()
+        conversion_result = converter.convert(Path(pdf_path), page_range=(page_no, page_no))
+        page_texts.append(conversion_result.document.export_to_markdown())
+        page_seconds.append(time.perf_counter() - start)
+
+    return {
+        "pdf": str(pdf_path),
+        "method": method,
+        "force_full_page_ocr": force_full_page_ocr,
+        "profile": profile,
+        "pages": num_pages,
+        "build_seconds": build_seconds,
+        "total_seconds": sum(page_seconds),
+        "pages_per_second": num_pages / sum(page_seconds) if page_seconds else 0.0,
+        "p50_page_seconds": statistics.median(page_seconds) if page_seconds else 0.0,
+        "p95_page_seconds": percentile(page_seconds, 95) if page_seconds else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "text": "\n\n".join(page_texts),
+    }
+
+
+def run_benchmark(
+    corpus: list[Path],
+    methods: list[str],
+    force_options: list[bool],
+    reference_method: str = None,
+    server_url: str = None,
+    profiles: list[str] = [CONVERSION_PROFILE],
+) -> list[dict]:
+    """
+    Benchmark each conversion method on each PDF of a corpus.
+
+    Every case runs in a fresh process, so model loading and peak memory are measured in isolation.
+
+    Args:
+    ----
+        corpus (list[Path]): PDFs to convert. A `<name>.md` file next to a PDF is used as its reference text.
+        methods (list[str]): Conversion methods to benchmark.
+        force_options (list[bool]): Values of force_full_page_ocr to benchmark each method with.
+        reference_method (str): Method whose output is the reference text for PDFs without a reference file.
+            Defaults to the first method.
+        server_url (str): Docling server URL for the server method.
+        profiles (list[str]): Conversion profiles to benchmark each method with.
+
+    Returns:
+    -------
+        list[dict]: One result per PDF, method, force_full_page_ocr value and profile.
+
+    """
+    reference_method = reference_method or methods[0]
+    mp_context = multiprocessing.get_context("spawn")
+    results = []
+    for pdf_path in corpus:
+        pdf_results = []
+        for method, force_full_page_ocr, profile in itertools.product(methods, force_options, profiles):
+            logger.info(f"Benchmarking {method} (force_full_page_ocr={force_full_page_ocr}, profile={profile}) on {pdf_path}")
+            # Executor workers are not daemonic, unlike multiprocessing.Pool workers, so a case may start processes of its own
+            with ProcessPoolExecutor(max_workers=1, mp_context=mp_context) as executor:
+                try:
+                    result = executor.submit(run_case, str(pdf_path), method, force_full_page_ocr, server_url, profile).result()
+                except Exception as e:
+                    logger.exception(f"Benchmark of {method} on {pdf_path} failed")
+                    result = {
+                        "pdf": str(pdf_path),
+                        "method": method,
+                        "force_full_page_ocr": force_full_page_ocr,
+                        "profile": profile,
+                        "error": repr(e),
+                    }
+            pdf_results.append(result)
+
+        # Score every result against the reference text
+        reference_path = Path(pdf_path).with_suffix(".md")
+        if reference_path.exists():
+            reference = reference_path.read_text()
+        else:
+            reference = next((r["text"] for r in pdf_results if r["method"] == reference_method and "text" in r), None)
+        for result in pdf_results:
+            if "text" in result and reference is not None:
+                rates = error_rates(reference, result["text"])
+                result["cer"] = rates["cer"]
+                result["wer"] = rates["wer"]
+                result["similarity"] = max(1 - rates["cer"], 0.0)
+            result.pop("text", None)
+        results += pdf_results
+
+    return results
+
+
+def main():
+    """Run the conversion benchmark from the command line."""
+    available_methods = ["easyocr"] + (["ocrmac"] if has_ocrmac() else []) + ["vlm"]
+    parser = argparse.ArgumentParser(description="Benchmark conversion methods for throughput, latency, memory and quality.")
+    parser.add_argument("corpus", nargs="*", type=Path, default=DEFAULT_CORPUS, help="PDFs to convert.")
+    parser.add_argument("--methods", nargs="+", default=available_methods, choices=["easyocr", "ocrmac", "server", "vlm"])
+    parser.add_argument("--force-full-page-ocr", choices=["both", "yes", "no"], default="both", help="Which OCR settings to run.")
+    parser.add_argument(
+        "--profiles", nargs="+", default=[CONVERSION_PROFILE], choices=list(CONVERSION_PROFILES), help="Conversion profiles to run."
+    )
+    parser.add_argument("--reference-method", default=None, help="Method used as the reference text. Defaults to the first method.")
+    parser.add_argument("--stub-server", action="store_true", help="Benchmark the server method against a local stub server.")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="Simulated stub server latency per page in seconds.")
+    parser.add_argument("-o", "--output", type=Path, default=None, help="JSON report path. Defaults to stdout.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+    force_options = {"both": [False, True], "yes": [True], "no": [False]}[args.force_full_page_ocr]
+    server_url = DOCLING_BASE_URL
+    stub_server = None
+    if args.stub_server:
+        stub_server = start_stub_server(latency=args.stub_latency)
+        server_url = f"http://127.0.0.1:{stub_server.server_address[1]}"
+    if "server" in args.methods and server_url is None:
+        parser.error("The server method requires DOCLING_BASE_URL or --stub-server")
+
+    try:
+        results = run_benchmark(
+            args.corpus, args.methods, force_options, reference_method=args.reference_method, server_url=server_url, profiles=args.profiles
+        )
+    finally:
+        if stub_server is not None:
+            stub_server.shutdown()
+
+    report = json.dumps({"results": results}, indent=2)
+    if args.output is None:
+        print(report)
+    else:
+        args.output.write_text(report)
+
+
+if __name__ == "__main__":
+    main()
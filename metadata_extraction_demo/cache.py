@@ -0,0 +1,272 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from metadata_extraction_demo.constants import (
+    CONVERSION_CACHE_DIR,
+    CONVERSION_CACHE_ENABLED,
+    CONVERSION_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_PATH,
+    RESPONSE_CACHE_SIZE,
+    RESPONSE_CACHE_TTL,
+)
+from metadata_extraction_demo.telemetry import register_cache
+
+if TYPE_CHECKING:
+    from docling_core.types.doc.document import DoclingDocument
+
+logger = logging.getLogger(__name__)
+
+
+def hash_file(path: str, block_size: int = 1024 * 1024) -> str:
+    """Compute the SHA-256 digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ConversionCache:
+    """Disk-backed, content-addressed cache of converted documents."""
+
+    def __init__(self, directory: Path = CONVERSION_CACHE_DIR, max_bytes: int = CONVERSION_CACHE_MAX_BYTES):
+        """Initialize."""
+        # The directory is created on the first put, so a cache that is never written leaves nothing on disk
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def key(self, path: str, namespace: str) -> str:
+        """Build a cache key from the file content and the conversion configuration."""
+        return hashlib.sha256(f"{hash_file(path)}:{namespace}".encode()).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> "DoclingDocument | None":
+        """Load a cached document, or None on a miss."""
+        from docling_core.types.doc.document import DoclingDocument
+
+        entry_path = self._entry_path(key)
+        try:
+            document = DoclingDocument.model_validate_json(entry_path.read_text())
+            # Mark the entry as recently used
+            os.utime(entry_path)
+        except FileNotFoundError:
+            document = None
+        except ValueError:
+            logger.warning(f"Discarding unreadable conversion cache entry {entry_path}")
+            entry_path.unlink(missing_ok=True)
+            document = None
+
+        self._count_lookup(document is not None, entry_path)
+        return document
+
+    def _count_lookup(self, hit: bool, entry_path: Path):
+        """Count a cache hit or miss."""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        logger.debug(f"Conversion cache {'hit' if hit else 'miss'} for {entry_path.name}, {self.stats()}")
+
+    def put(self, key: str, document: "DoclingDocument"):
+        """Store a document, evicting the least recently used entries beyond the size limit."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entry_path = self._entry_path(key)
+        tmp_path = entry_path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_text(document.model_dump_json())
+        os.replace(tmp_path, entry_path)
+        self.evict()
+
+    def get_pages(self, key: str) -> list[str] | None:
+        """Load cached per-page markdown, or None on a miss."""
+        entry_path = self.directory / f"{key}.pages.json"
+        try:
+            pages = json.loads(entry_path.read_text())
+            os.utime(entry_path)
+        except FileNotFoundError:
+            pages = None
+        except ValueError:
+            logger.warning(f"Discarding unreadable conversion cache entry {entry_path}")
+            entry_path.unlink(missing_ok=True)
+            pages = None
+
+        self._count_lookup(pages is not None, entry_path)
+        return pages
+
+    def put_pages(self, key: str, pages: list[str]):
+        """Store per-page markdown, evicting the least recently used entries beyond the size limit."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entry_path = self.directory / f"{key}.pages.json"
+        tmp_path = entry_path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_text(json.dumps(pages))
+        os.replace(tmp_path, entry_path)
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            entries = []
+            for entry_path in self.directory.glob("*.json"):
+                try:
+                    stat = entry_path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry_path))
+            total_bytes = sum(size for _, size, _ in entries)
+            for _, size, entry_path in sorted(entries):
+                if total_bytes <= self.max_bytes:
+                    break
+                entry_path.unlink(missing_ok=True)
+                total_bytes -= size
+                self.evictions += 1
+                logger.info(f"Evicted conversion cache entry {entry_path.name}")
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            for entry_path in self.directory.glob("*.json"):
+                entry_path.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        """Get the cache hit/miss counters."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class ResponseCache:
+    """LRU cache of parsed LLM responses with a TTL, held in memory and optionally persisted to SQLite."""
+
+    def __init__(self, max_size: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL, path: str = RESPONSE_CACHE_PATH):
+        """Initialize."""
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: OrderedDict[str, tuple[float, str, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, created_at REAL, model TEXT, value TEXT)")
+            self._db.commit()
+            self._prune()
+
+    def key(self, request: dict) -> str:
+        """Build a cache key from a JSON-serializable request (model, messages, schema and sampling parameters)."""
+        return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """Get a cached response, or None on a miss or if the entry has expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute("SELECT created_at, model, value FROM responses WHERE key = ?", (key,)).fetchone()
+                entry = tuple(row) if row is not None else None
+
+            if entry is not None and time.time() - entry[0] > self.ttl:
+                self._delete(key)
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._store(key, entry)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key: str, model: str, value: str):
+        """Store a response."""
+        entry = (time.time(), model, value)
+        with self._lock:
+            self._store(key, entry)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO responses (key, created_at, model, value) VALUES (?, ?, ?, ?)", (key, *entry))
+                self._db.commit()
+
+    def invalidate(self, key: str = None, model: str = None):
+        """Remove a single entry by key, or all entries produced by a model."""
+        with self._lock:
+            if key is not None:
+                self._delete(key)
+            if model is not None:
+                for entry_key in [k for k, entry in self._entries.items() if entry[1] == model]:
+                    del self._entries[entry_key]
+                if self._db is not None:
+                    self._db.execute("DELETE FROM responses WHERE model = ?", (model,))
+                    self._db.commit()
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        """Get the cache counters."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "size": len(self._entries),
+            }
+
+    def _store(self, key: str, entry: tuple[float, str, str]):
+        """Insert an entry as most recently used, evicting the least recently used entries from memory and disk. Must hold the lock."""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        evicted_keys = []
+        while len(self._entries) > self.max_size:
+            evicted_key, _ = self._entries.popitem(last=False)
+            evicted_keys.append((evicted_key,))
+            self.evictions += 1
+        if evicted_keys and self._db is not None:
+            self._db.executemany("DELETE FROM responses WHERE key = ?", evicted_keys)
+            self._db.commit()
+
+    def _prune(self):
+        """Delete expired entries and the oldest entries beyond max_size from disk, e.g. left by a previous run."""
+        with self._lock:
+            expired = self._db.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,)).rowcount
+            evicted = self._db.execute(
+                "DELETE FROM responses WHERE key NOT IN (SELECT key FROM responses ORDER BY created_at DESC LIMIT ?)", (self.max_size,)
+            ).rowcount
+            self._db.commit()
+            self.expirations += expired
+            self.evictions += evicted
+
+    def _delete(self, key: str):
+        """Delete an entry from memory and disk. Must hold the lock."""
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db.commit()
+
+
+conversion_cache = ConversionCache() if CONVERSION_CACHE_ENABLED else None
+response_cache = ResponseCache() if RESPONSE_CACHE_ENABLED else None
+register_cache("conversion", conversion_cache)
+register_cache("response", response_cache)
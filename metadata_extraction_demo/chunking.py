@@ -0,0 +1,94 @@
+import json
+import re
+from collections import Counter
+from typing import TYPE_CHECKING, Literal, Optional
+
+from pydantic import BaseModel, create_model
+
+if TYPE_CHECKING:
+    from docling_core.types.doc.document import DoclingDocument
+
+HEADING_PATTERN = re.compile(r"^#{1,6} ", flags=re.MULTILINE)
+
+ReconciliationRule = Literal["first", "last", "most_common"]
+
+
+def split_markdown_sections(text: str) -> list[str]:
+    """Split markdown text into sections, starting a new section at every heading."""
+    starts = [match.start() for match in HEADING_PATTERN.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    sections = [text[start:end].strip() for start, end in zip(starts, starts[1:] + [len(text)])]
+    return [section for section in sections if section]
+
+
+def group_sections(sections: list[str], max_chars: int) -> list[str]:
+    """Greedily group consecutive sections into chunks of at most max_chars, hard-splitting oversized sections."""
+    chunks = []
+    current = ""
+    for section in sections:
+        pieces = [section[i : i + max_chars] for i in range(0, len(section), max_chars)]
+        for piece in pieces:
+            if current and len(current) + len(piece) + 2 > max_chars:
+                chunks.append(current)
+                current = ""
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_document(document: "DoclingDocument", max_chars: int) -> list[str]:
+    """Split a docling document into markdown chunks of at most max_chars along its page and section structure."""
+    if not document.pages:
+        return group_sections(split_markdown_sections(document.export_to_markdown()), max_chars)
+    return split_pages([document.export_to_markdown(page_no=page_no) for page_no in sorted(document.pages)], max_chars)
+
+
+def split_pages(page_texts: list[str], max_chars: int) -> list[str]:
+    """Group the markdown of consecutive pages into chunks of at most max_chars, splitting oversized pages by section."""
+    sections = []
+    for page_text in page_texts:
+        sections += [page_text] if len(page_text) <= max_chars else split_markdown_sections(page_text)
+    return group_sections(sections, max_chars)
+
+
+def make_partial_model(model: type[BaseModel]) -> type[BaseModel]:
+    """Create a copy of a model where every top-level field is optional, for extracting from part of a document."""
+    fields = {name: (Optional[field.annotation], None) for name, field in model.model_fields.items()}
+    return create_model(f"Partial{model.__name__}", **fields)
+
+
+def merge_results(results: list[dict], rule: ReconciliationRule = "first") -> dict:
+    """
+    Merge partial extraction results field by field.
+
+    Args:
+    ----
+        results (list[dict]): Partial results, in document order.
+        rule (str): How to reconcile conflicting values. One of
+            "first" (first non-null value in the document),
+            "last" (last non-null value in the document),
+            "most_common" (most frequent non-null value, ties broken by document order).
+
+    Returns:
+    -------
+        dict: Merged result.
+
+    """
+    merged = {}
+    fields = dict.fromkeys(field for result in results for field in result)
+    for field in fields:
+        values = [result[field] for result in results if result.get(field) is not None]
+        if not values:
+            merged[field] = None
+        elif rule == "first":
+            merged[field] = values[0]
+        elif rule == "last":
+            merged[field] = values[-1]
+        elif rule == "most_common":
+            counts = Counter(json.dumps(value, sort_keys=True) for value in values)
+            merged[field] = max(values, key=lambda value: counts[json.dumps(value, sort_keys=True)])
+        else:
+            raise ValueError(f"Unsupported reconciliation rule: {rule}")
+    return merged
@@ -1,7 +1,7 @@
 import os
+from functools import lru_cache
 from pathlib import Path
 
-import torch
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -16,10 +16,97 @@ OPENAI_IGNORE_SSL = os.getenv("OPENAI_IGNORE_SSL", False)
 # Docling Host info (Optional)
 DOCLING_BASE_URL = os.getenv("DOCLING_BASE_URL", None)
 DOCLING_API_KEY = os.getenv("DOCLING_API_KEY", None)
+DOCLING_MAX_WORKERS = int(os.getenv("DOCLING_MAX_WORKERS", 4))
+DOCLING_PAGES_PER_REQUEST = int(os.getenv("DOCLING_PAGES_PER_REQUEST", 1))
+DOCLING_MAX_RETRIES = int(os.getenv("DOCLING_MAX_RETRIES", 3))
+DOCLING_TIMEOUT = float(os.getenv("DOCLING_TIMEOUT", 300))
+
+# Conversion profiles
+CONVERSION_PROFILE = os.getenv("CONVERSION_PROFILE", "accurate").lower()
+CONVERSION_NUM_THREADS = int(os.getenv("CONVERSION_NUM_THREADS", 4))
+
+# VLM conversion
+VLM_PAGES_PER_CONVERSION = int(os.getenv("VLM_PAGES_PER_CONVERSION", 4))
+VLM_BATCH_SIZE = int(os.getenv("VLM_BATCH_SIZE", 4))
+VLM_WORKER_PROCESS = os.getenv("VLM_WORKER_PROCESS", "false").lower() in ("true", "1", "yes")
+
+# Selective OCR: pages whose text layer falls below these thresholds are sent to OCR
+SELECTIVE_OCR_MIN_CHARS = int(os.getenv("SELECTIVE_OCR_MIN_CHARS", 32))
+SELECTIVE_OCR_MIN_QUALITY = float(os.getenv("SELECTIVE_OCR_MIN_QUALITY", 0.8))
+# Pages mostly covered by images are sent to OCR unless their text layer is dense enough to be the body text
+SELECTIVE_OCR_MAX_IMAGE_COVERAGE = float(os.getenv("SELECTIVE_OCR_MAX_IMAGE_COVERAGE", 0.5))
+SELECTIVE_OCR_MIN_DENSITY = float(os.getenv("SELECTIVE_OCR_MIN_DENSITY", 8))
+
+# App queueing and concurrency
+QUEUE_MAX_SIZE = int(os.getenv("QUEUE_MAX_SIZE", 64))
+DEFAULT_CONCURRENCY = int(os.getenv("DEFAULT_CONCURRENCY", 4))
+OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", 1))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 8))
+DIFF_CONCURRENCY = int(os.getenv("DIFF_CONCURRENCY", 1))
+FILE_CONCURRENCY = int(os.getenv("FILE_CONCURRENCY", 2))
+
+# OCR comparison diffs
+DIFF_MAX_CHARS = int(os.getenv("DIFF_MAX_CHARS", 500_000))
+DIFF_MAX_WORD_TOKENS = int(os.getenv("DIFF_MAX_WORD_TOKENS", 2_000))
+
+# Document converter pool
+CONVERTER_POOL_SIZE = int(os.getenv("CONVERTER_POOL_SIZE", 4))
+CONVERTER_WARMUP_METHODS = [m.strip().lower() for m in os.getenv("CONVERTER_WARMUP_METHODS", "easyocr").split(",") if m.strip()]
+
+# Compiled metadata schemas
+SCHEMA_CACHE_SIZE = int(os.getenv("SCHEMA_CACHE_SIZE", 32))
+
+# Conversion cache
+CONVERSION_CACHE_ENABLED = os.getenv("CONVERSION_CACHE_ENABLED", "true").lower() in ("true", "1", "yes")
+CONVERSION_CACHE_DIR = Path(os.getenv("CONVERSION_CACHE_DIR", DIRECTORY_PATH / ".cache" / "conversions"))
+CONVERSION_CACHE_MAX_BYTES = int(os.getenv("CONVERSION_CACHE_MAX_BYTES", 1024**3))
+
+# LLM response cache (Optional)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() in ("true", "1", "yes")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 256))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 24 * 60 * 60))
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", None)
+
+# Chunked extraction
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", 16000))
+CHUNK_MAX_WORKERS = int(os.getenv("CHUNK_MAX_WORKERS", 4))
+CHUNK_RECONCILIATION = os.getenv("CHUNK_RECONCILIATION", "first")
+
+# Context pruning
+PRUNE_TOP_K = int(os.getenv("PRUNE_TOP_K", 8))
+PRUNE_TOKEN_BUDGET = int(os.getenv("PRUNE_TOKEN_BUDGET", 4000))
+PRUNE_SECTION_MAX_CHARS = int(os.getenv("PRUNE_SECTION_MAX_CHARS", 4000))
+
+# Batch extraction
+BATCH_CONVERSION_WORKERS = int(os.getenv("BATCH_CONVERSION_WORKERS", 2))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", 8))
 
 # Tracing (Optional)
 TRACELOOP_BASE_URL = os.getenv("TRACELOOP_BASE_URL", None)
-TRACELOOP_DISABLE_BATCH = os.getenv("TRACELOOP_DISABLE_BATCH", True)
+TRACELOOP_DISABLE_BATCH = os.getenv("TRACELOOP_DISABLE_BATCH", "true").lower() in ("true", "1", "yes")
+
+# Metrics (Optional)
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+
+# Model listing
+MODEL_LIST_TIMEOUT = float(os.getenv("MODEL_LIST_TIMEOUT", 10))
+MODEL_LIST_TTL = float(os.getenv("MODEL_LIST_TTL", 300))
+
+# Startup
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", 5))
+
 
 # Device
-DEVICE = "cuda" if torch.cuda.is_available() else ("mps" if torch.backends.mps.is_available() else "cpu")
+@lru_cache
+def get_device() -> str:
+    """Get the torch device to run models on. Imports torch, so it is only called once a model is needed."""
+    import torch
+
+    return "cuda" if torch.cuda.is_available() else ("mps" if torch.backends.mps.is_available() else "cpu")
+
+
+def __getattr__(name: str):
+    """Resolve DEVICE lazily, so importing the constants does not import torch."""
+    if name == "DEVICE":
+        return get_device()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
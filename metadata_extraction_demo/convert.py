@@ -1,35 +1,103 @@
+import json
 import logging
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import Literal
-
-from docling.datamodel.base_models import InputFormat
-from docling.datamodel.pipeline_options import (
-    EasyOcrOptions,
-    PdfPipelineOptions,
-    VlmPipelineOptions,
-    smoldocling_vlm_conversion_options,
-    smoldocling_vlm_mlx_conversion_options,
-)
-from docling.document_converter import DocumentConverter, PdfFormatOption
-from docling.pipeline.standard_pdf_pipeline import StandardPdfPipeline
-from docling.pipeline.vlm_pipeline import VlmPipeline
-from docling_core.types.doc.document import DoclingDocument
+from typing import TYPE_CHECKING, Literal
 
-from metadata_extraction_demo.constants import DOCLING_API_KEY, DOCLING_BASE_URL
-from metadata_extraction_demo.docling_server import DoclingServerConverter
+from metadata_extraction_demo.cache import conversion_cache
+from metadata_extraction_demo.constants import (
+    CONVERSION_NUM_THREADS,
+    CONVERSION_PROFILE,
+    CONVERTER_POOL_SIZE,
+    DOCLING_API_KEY,
+    DOCLING_BASE_URL,
+    VLM_WORKER_PROCESS,
+    get_device,
+)
+from metadata_extraction_demo.selective_ocr import SelectiveOcrConverter
+from metadata_extraction_demo.telemetry import span
 from metadata_extraction_demo.utils import has_mlx_vlm
 
+# Docling and its model backends are heavy to import, so they are only imported once a converter is built
+if TYPE_CHECKING:
+    from docling.datamodel.base_models import InputFormat
+    from docling.document_converter import DocumentConverter
+    from docling_core.types.doc.document import DoclingDocument
+
 logger = logging.getLogger(__name__)
 
+# File extensions Docling can convert. Only PDFs go through the conversion method, other formats are read by their own backends.
+PDF_EXTENSIONS = [".pdf"]
+NATIVE_EXTENSIONS = [
+    ".docx",
+    ".pptx",
+    ".html",
+    ".htm",
+    ".md",
+    ".adoc",
+    ".asciidoc",
+    ".csv",
+    ".png",
+    ".jpg",
+    ".jpeg",
+    ".tif",
+    ".tiff",
+    ".bmp",
+]
+SUPPORTED_EXTENSIONS = PDF_EXTENSIONS + NATIVE_EXTENSIONS
+
+# Conversion profiles trading fidelity for speed. "accurate" matches the converter settings used before profiles existed.
+CONVERSION_PROFILES = {
+    "fast": {
+        # Skip TableFormer, tables are exported as text, and only OCR bitmaps covering a fifth of the page
+        "do_table_structure": False,
+        "table_mode": "fast",
+        "ocr_options": {"bitmap_area_threshold": 0.2},
+        "ocrmac_options": {"recognition": "fast"},
+    },
+    "balanced": {
+        "do_table_structure": True,
+        "table_mode": "fast",
+        "ocr_options": {},
+        "ocrmac_options": {"recognition": "fast"},
+    },
+    "accurate": {
+        "do_table_structure": True,
+        "table_mode": "accurate",
+        "ocr_options": {},
+        "ocrmac_options": {},
+    },
+}
+
+
+def get_conversion_profile(profile: str) -> dict:
+    """Get the settings of a conversion profile."""
+    if profile not in CONVERSION_PROFILES:
+        raise ValueError(f"Unsupported conversion profile: {profile}")
+    return CONVERSION_PROFILES[profile]
+
 
 def build_local_docling_converter(
-    ocr_engine: Literal["easyocr", "ocrmac", "vlm"], ocr_options: dict = {}, allowed_formats: list[InputFormat] = None
+    ocr_engine: Literal["easyocr", "ocrmac", "vlm"],
+    ocr_options: dict = {},
+    allowed_formats: "list[InputFormat]" = None,
+    do_ocr: bool = True,
+    profile: str = CONVERSION_PROFILE,
 ):
-    """Create docling document converter."""
-    # Set default pipeline options
-    pipeline_options = PdfPipelineOptions()
-    pipeline_options.do_ocr = True
-    pipeline_options.do_table_structure = True
+    """Create docling document converter. Without OCR, the text is read from the PDF text layer."""
+    from docling.datamodel.base_models import InputFormat
+    from docling.datamodel.pipeline_options import AcceleratorOptions, EasyOcrOptions, PdfPipelineOptions, TableFormerMode
+    from docling.document_converter import DocumentConverter, ImageFormatOption, PdfFormatOption
+    from docling.pipeline.standard_pdf_pipeline import StandardPdfPipeline
+
+    # Set pipeline options from the profile
+    settings = get_conversion_profile(profile)
+    accelerator_options = AcceleratorOptions(num_threads=CONVERSION_NUM_THREADS, device=get_device())
+    pipeline_options = PdfPipelineOptions(accelerator_options=accelerator_options)
+    pipeline_options.do_ocr = do_ocr
+    pipeline_options.do_table_structure = settings["do_table_structure"]
+    pipeline_options.table_structure_options.mode = TableFormerMode(settings["table_mode"])
     pipeline_options.table_structure_options.do_cell_matching = True
     pipeline_cls = StandardPdfPipeline
 
@@ -37,12 +105,20 @@ def build_local_docling_converter(
     if ocr_engine == "ocrmac":
         from docling.datamodel.pipeline_options import OcrMacOptions
 
-        pipeline_options.ocr_options = OcrMacOptions(**ocr_options)
+        pipeline_options.ocr_options = OcrMacOptions(**(settings["ocr_options"] | settings["ocrmac_options"] | ocr_options))
     elif ocr_engine == "easyocr":
-        pipeline_options.ocr_options = EasyOcrOptions(**ocr_options)
+        pipeline_options.ocr_options = EasyOcrOptions(**(settings["ocr_options"] | ocr_options))
     elif ocr_engine == "vlm":
-        pipeline_cls = VlmPipeline
-        pipeline_options = VlmPipelineOptions()
+        from docling.datamodel.pipeline_options import (
+            VlmPipelineOptions,
+            smoldocling_vlm_conversion_options,
+            smoldocling_vlm_mlx_conversion_options,
+        )
+
+        from metadata_extraction_demo.vlm_batch import BatchedVlmPipeline
+
+        pipeline_cls = BatchedVlmPipeline
+        pipeline_options = VlmPipelineOptions(accelerator_options=accelerator_options)
         pipeline_options.force_backend_text = False
         if has_mlx_vlm():
             logger.info("Loading model to MLX")
@@ -53,16 +129,19 @@ def build_local_docling_converter(
     else:
         raise ValueError(f"Unsupported OCR engine: {ocr_engine}")
 
-    # Create converter
+    # Create converter. Images go through the same pipeline as PDFs, so they follow the profile and accelerator options too.
     format_options = {
         InputFormat.PDF: PdfFormatOption(
             pipeline_cls=pipeline_cls,
             pipeline_options=pipeline_options,
-        )
+        ),
+        InputFormat.IMAGE: ImageFormatOption(
+            pipeline_cls=pipeline_cls,
+            pipeline_options=pipeline_options,
+        ),
     }
-    converter = DocumentConverter(
-        format_options=format_options,
-        allowed_formats=[
+    if allowed_formats is None:
+        allowed_formats = [
             InputFormat.PDF,
             InputFormat.IMAGE,
             InputFormat.DOCX,
@@ -71,20 +150,86 @@ def build_local_docling_converter(
             InputFormat.ASCIIDOC,
             InputFormat.CSV,
             InputFormat.MD,
-        ],
-    )
+        ]
+    converter = DocumentConverter(format_options=format_options, allowed_formats=allowed_formats)
     return converter
 
 
-def build_document_converter(method: str, force_full_page_ocr: bool = False) -> DocumentConverter:
-    """Build the Docling document converter."""
+def build_native_converter(profile: str = CONVERSION_PROFILE) -> "DocumentConverter":
+    """Create a docling document converter for the formats other than PDF, which docling reads with their own backends."""
+    from docling.datamodel.base_models import InputFormat
+
+    allowed_formats = [
+        InputFormat.IMAGE,
+        InputFormat.DOCX,
+        InputFormat.HTML,
+        InputFormat.PPTX,
+        InputFormat.ASCIIDOC,
+        InputFormat.CSV,
+        InputFormat.MD,
+    ]
+    return build_local_docling_converter(ocr_engine="easyocr", allowed_formats=allowed_formats, profile=profile)
+
+
+def build_document_converter(
+    method: str,
+    force_full_page_ocr: bool = False,
+    ocr_options: dict = None,
+    selective_ocr: bool = False,
+    profile: str = CONVERSION_PROFILE,
+    ocr_converter: "DocumentConverter" = None,
+    text_converter: "DocumentConverter" = None,
+) -> "DocumentConverter":
+    """
+    Build the Docling document converter.
+
+    Args:
+    ----
+        method (str): Conversion method. The "native" method builds a converter for formats other than PDF,
+            and the "text" method one that reads the PDF text layer without OCR.
+        force_full_page_ocr (bool): Whether to force full page OCR.
+        ocr_options (dict): Additional OCR options.
+        selective_ocr (bool): Whether to only OCR pages without a usable text layer.
+        profile (str): Conversion profile.
+        ocr_converter (DocumentConverter): Existing converter for the method, reused for the OCR pages with selective OCR.
+        text_converter (DocumentConverter): Existing "text" converter, reused for the text layer pages with selective OCR.
+
+    Returns:
+    -------
+        DocumentConverter: The converter.
+
+    """
+    ocr_options = ocr_options or {}
     if method == "server":
-        addtl_ocr_options = {"force_ocr": force_full_page_ocr, "image_export_mode": "placeholder"}
-        converter = DoclingServerConverter(base_url=DOCLING_BASE_URL, api_key=DOCLING_API_KEY, addtl_ocr_options=addtl_ocr_options)
+        from metadata_extraction_demo.docling_server import DoclingServerConverter
+
+        settings = get_conversion_profile(profile)
+        profile_options = {"do_table_structure": settings["do_table_structure"], "table_mode": settings["table_mode"]}
+        addtl_ocr_options = {"force_ocr": force_full_page_ocr, "image_export_mode": "placeholder"} | profile_options | ocr_options
+        converter = DoclingServerConverter(
+            base_url=DOCLING_BASE_URL, api_key=DOCLING_API_KEY, addtl_ocr_options=addtl_ocr_options, selective_ocr=selective_ocr
+        )
 
     elif method in ["easyocr", "ocrmac", "vlm"]:
-        ocr_options = {"force_full_page_ocr": force_full_page_ocr}
-        converter = build_local_docling_converter(ocr_engine=method, ocr_options=ocr_options)
+        ocr_options = {"force_full_page_ocr": force_full_page_ocr} | ocr_options
+        if ocr_converter is not None:
+            converter = ocr_converter
+        elif method == "vlm" and VLM_WORKER_PROCESS:
+            from metadata_extraction_demo.vlm_worker import VlmWorkerConverter
+
+            converter = VlmWorkerConverter(profile=profile)
+        else:
+            converter = build_local_docling_converter(ocr_engine=method, ocr_options=ocr_options, profile=profile)
+        if selective_ocr:
+            text_converter = text_converter or build_document_converter(method="text", profile=profile)
+            converter = SelectiveOcrConverter(ocr_converter=converter, text_converter=text_converter)
+
+    elif method == "text":
+        # The OCR engine is never loaded without OCR, so every method shares this converter for its text layer pages
+        converter = build_local_docling_converter(ocr_engine="easyocr", do_ocr=False, profile=profile)
+
+    elif method == "native":
+        converter = build_native_converter(profile=profile)
 
     else:
         raise ValueError(f"Unsupported conversion method: {method}")
@@ -92,20 +237,166 @@ def build_document_converter(method: str, force_full_page_ocr: bool = False) ->
     return converter
 
 
-def convert_pdf_to_docling(pdf_path: str, method: str, force_full_page_ocr: bool = False) -> DoclingDocument:
-    """Convert a PDF to a docling document."""
+def converter_options(
+    path: str, method: str, force_full_page_ocr: bool = False, selective_ocr: bool = False, profile: str = CONVERSION_PROFILE
+) -> dict:
+    """Get the converter options for a file, routing formats other than PDF to the native converter."""
+    if Path(path).suffix.lower() not in PDF_EXTENSIONS:
+        return {"method": "native", "profile": profile}
+    return {"method": method, "force_full_page_ocr": force_full_page_ocr, "selective_ocr": selective_ocr, "profile": profile}
+
+
+def converter_key(
+    method: str, force_full_page_ocr: bool = False, ocr_options: dict = None, selective_ocr: bool = False, profile: str = CONVERSION_PROFILE
+) -> str:
+    """Build a stable key identifying a converter configuration."""
+    if method == "vlm":
+        # OCR options and profiles don't affect the VLM, so every configuration shares one model instance.
+        # The profile still applies to the text layer converter of selective OCR.
+        force_full_page_ocr, ocr_options = False, None
+        profile = profile if selective_ocr else "accurate"
+    config = {"method": method, "force_full_page_ocr": bool(force_full_page_ocr), "ocr_options": ocr_options or {}}
+    # Only add options that differ from the original settings, so keys of existing cache entries stay valid
+    if selective_ocr:
+        config["selective_ocr"] = True
+    if profile != "accurate":
+        config["profile"] = profile
+    return json.dumps(config, sort_keys=True)
+
+
+class ConverterPool:
+    """Thread-safe, size-bounded LRU registry of document converters."""
+
+    def __init__(self, max_size: int = CONVERTER_POOL_SIZE):
+        """Initialize."""
+        self.max_size = max_size
+        self._converters: OrderedDict[str, "DocumentConverter"] = OrderedDict()
+        self._build_locks: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        method: str,
+        force_full_page_ocr: bool = False,
+        ocr_options: dict = None,
+        selective_ocr: bool = False,
+        profile: str = CONVERSION_PROFILE,
+    ) -> "DocumentConverter":
+        """Check out a converter, building and initializing it on first use."""
+        key = converter_key(method, force_full_page_ocr, ocr_options, selective_ocr, profile)
+        with self._lock:
+            if key in self._converters:
+                self._converters.move_to_end(key)
+                return self._converters[key]
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        # Selective OCR checks out the pooled converters of the method and of the text layer, which count towards max_size
+        # like any other configuration. A converter evicted while a selective converter still uses it stays loaded until both are gone.
+        ocr_converter = text_converter = None
+        if selective_ocr and method not in ("server", "native", "text"):
+            ocr_converter = self.get(method=method, force_full_page_ocr=force_full_page_ocr, ocr_options=ocr_options, profile=profile)
+            text_converter = self.get(method="text", profile=profile)
+
+        # Build outside the registry lock so other configurations are not blocked while models load
+        with build_lock:
+            with self._lock:
+                if key in self._converters:
+                    self._converters.move_to_end(key)
+                    return self._converters[key]
+
+            logger.info(f"Building document converter for {key}")
+            build_attributes = {
+                "method": method,
+                "force_full_page_ocr": bool(force_full_page_ocr),
+                "selective_ocr": selective_ocr,
+                "profile": profile,
+            }
+            with span("converter.build", **build_attributes):
+                converter = build_document_converter(
+                    method=method,
+                    force_full_page_ocr=force_full_page_ocr,
+                    ocr_options=ocr_options,
+                    selective_ocr=selective_ocr,
+                    profile=profile,
+                    ocr_converter=ocr_converter,
+                    text_converter=text_converter,
+                )
+                if method != "server":
+                    from docling.datamodel.base_models import InputFormat
+
+                    # Load model weights now, so concurrent conversions never race to initialize the pipeline
+                    for input_format in converter.allowed_formats if method == "native" else [InputFormat.PDF]:
+                        converter.initialize_pipeline(input_format)
+
+            with self._lock:
+                self._converters[key] = converter
+                self._build_locks.pop(key, None)
+                while len(self._converters) > self.max_size:
+                    evicted_key, _ = self._converters.popitem(last=False)
+                    logger.info(f"Evicted document converter for {evicted_key}")
+
+        return converter
+
+    def warm_up(self, methods: list[str], force_full_page_ocr: bool = False):
+        """Build converters ahead of the first request."""
+        for method in methods[: self.max_size]:
+            try:
+                self.get(method=method, force_full_page_ocr=force_full_page_ocr)
+            except Exception:
+                logger.exception(f"Failed to warm up document converter for {method}")
+
+    def clear(self):
+        """Drop all pooled converters."""
+        with self._lock:
+            self._converters.clear()
+
+
+converter_pool = ConverterPool()
+
+
+def get_document_converter(
+    method: str, force_full_page_ocr: bool = False, ocr_options: dict = None, selective_ocr: bool = False, profile: str = CONVERSION_PROFILE
+) -> "DocumentConverter":
+    """Get a shared Docling document converter from the process-wide pool."""
+    return converter_pool.get(
+        method=method, force_full_page_ocr=force_full_page_ocr, ocr_options=ocr_options, selective_ocr=selective_ocr, profile=profile
+    )
+
+
+def convert_pdf_to_docling(
+    pdf_path: str, method: str, force_full_page_ocr: bool = False, selective_ocr: bool = False, profile: str = CONVERSION_PROFILE
+) -> "DoclingDocument":
+    """Convert a PDF, or any other supported document, to a docling document."""
     path = Path(pdf_path)
-    converter = build_document_converter(method=method, force_full_page_ocr=force_full_page_ocr)
-    conversion_result = converter.convert(path)
+    options = converter_options(path, method, force_full_page_ocr=force_full_page_ocr, selective_ocr=selective_ocr, profile=profile)
+
+    # Check the cache first
+    cache_key = None
+    if conversion_cache is not None:
+        cache_key = conversion_cache.key(path, namespace=converter_key(**options))
+        docling = conversion_cache.get(cache_key)
+        if docling is not None:
+            logger.info("Loaded converted document from cache")
+            return docling
+
+    converter = get_document_converter(**options)
+    with span("convert.document", method=options["method"], force_full_page_ocr=bool(force_full_page_ocr)):
+        conversion_result = converter.convert(path)
     docling = conversion_result.document
 
+    if cache_key is not None:
+        conversion_cache.put(cache_key, docling)
+
     return docling
 
 
-def convert_pdf_to_text(pdf_path: str, method: str, force_full_page_ocr: bool = False):
-    """Convert a PDF to Markdown text."""
+def convert_pdf_to_text(
+    pdf_path: str, method: str, force_full_page_ocr: bool = False, selective_ocr: bool = False, profile: str = CONVERSION_PROFILE
+):
+    """Convert a PDF, or any other supported document, to Markdown text."""
     # Convert file to docling
-    docling = convert_pdf_to_docling(pdf_path, method, force_full_page_ocr)
+    docling = convert_pdf_to_docling(pdf_path, method, force_full_page_ocr, selective_ocr, profile)
     # Convert docling to text
-    text = docling.export_to_markdown()
+    with span("convert.export_markdown"):
+        text = docling.export_to_markdown()
     return text
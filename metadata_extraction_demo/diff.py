@@ -0,0 +1,235 @@
+import bisect
+import re
+from collections import Counter
+from difflib import SequenceMatcher
+
+from metadata_extraction_demo.constants import DIFF_MAX_CHARS, DIFF_MAX_WORD_TOKENS
+
+WORD_PATTERN = re.compile(r"\s+|\S+")
+
+# Largest gap between anchors, in compared pairs of lines, that is aligned exhaustively
+MAX_GAP_COMPARISONS = 250_000
+
+
+def tokenize_words(text: str) -> list[str]:
+    """Split text into words and the whitespace between them, so the tokens join back into the original text."""
+    return WORD_PATTERN.findall(text)
+
+
+def _longest_increasing_run(pairs: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    """Get the longest subsequence of (i, j) pairs, sorted by i, whose j values are increasing."""
+    tails = []
+    tail_indices = []
+    previous = [-1] * len(pairs)
+    for index, (_, j) in enumerate(pairs):
+        position = bisect.bisect_left(tails, j)
+        if position == len(tails):
+            tails.append(j)
+            tail_indices.append(index)
+        else:
+            tails[position] = j
+            tail_indices[position] = index
+        previous[index] = tail_indices[position - 1] if position else -1
+
+    run = []
+    index = tail_indices[-1] if tail_indices else -1
+    while index != -1:
+        run.append(pairs[index])
+        index = previous[index]
+    return run[::-1]
+
+
+def _common_affixes(a: list, b: list, alo: int, ahi: int, blo: int, bhi: int) -> tuple[int, int]:
+    """Get the lengths of the common prefix and suffix of two ranges, without overlapping."""
+    prefix = 0
+    while alo + prefix < ahi and blo + prefix < bhi and a[alo + prefix] == b[blo + prefix]:
+        prefix += 1
+    suffix = 0
+    while ahi - suffix > alo + prefix and bhi - suffix > blo + prefix and a[ahi - suffix - 1] == b[bhi - suffix - 1]:
+        suffix += 1
+    return prefix, suffix
+
+
+def _unique_anchors(a: list, b: list, alo: int, ahi: int, blo: int, bhi: int) -> list[tuple[int, int]]:
+    """Get the longest in-order run of (i, j) pairs of elements that occur exactly once in both ranges."""
+    counts_a = Counter(a[alo:ahi])
+    counts_b = Counter(b[blo:bhi])
+    positions_b = {b[j]: j for j in range(blo, bhi) if counts_b[b[j]] == 1}
+    pairs = [(i, positions_b[a[i]]) for i in range(alo, ahi) if counts_a[a[i]] == 1 and a[i] in positions_b]
+    return _longest_increasing_run(pairs)
+
+
+def matching_blocks(a: list, b: list) -> list[tuple[int, int, int]]:
+    """
+    Find the (i, j, size) blocks where two sequences match, in order.
+
+    Uses patience diffing: common prefixes and suffixes are matched directly, elements that
+    occur exactly once in both sequences anchor the alignment, and only small gaps between
+    anchors are aligned exhaustively. This keeps long documents with many scattered changes
+    close to linear time.
+    """
+    blocks = []
+    # Work items are either ranges still to align or matched blocks deferred until the ranges before them are done
+    stack = [("range", (0, len(a), 0, len(b)))]
+    while stack:
+        kind, item = stack.pop()
+        if kind == "block":
+            blocks.append(item)
+            continue
+        alo, ahi, blo, bhi = item
+
+        # Match the common prefix and suffix
+        prefix, suffix = _common_affixes(a, b, alo, ahi, blo, bhi)
+        if prefix:
+            blocks.append((alo, blo, prefix))
+            alo, blo = alo + prefix, blo + prefix
+        if suffix:
+            stack.append(("block", (ahi - suffix, bhi - suffix, suffix)))
+            ahi, bhi = ahi - suffix, bhi - suffix
+        if alo >= ahi or blo >= bhi:
+            continue
+
+        # Anchor on elements that occur exactly once on both sides
+        anchors = _unique_anchors(a, b, alo, ahi, blo, bhi)
+
+        if not anchors:
+            if (ahi - alo) * (bhi - blo) <= MAX_GAP_COMPARISONS:
+                matcher = SequenceMatcher(None, a[alo:ahi], b[blo:bhi], autojunk=False)
+                blocks += [(alo + i, blo + j, size) for i, j, size in matcher.get_matching_blocks() if size]
+            continue
+
+        # Push the gaps between anchors in reverse so they are processed in order
+        bounds = [(alo - 1, blo - 1)] + anchors + [(ahi, bhi)]
+        for (i1, j1), (i2, j2) in reversed(list(zip(bounds, bounds[1:]))):
+            if i2 < ahi:
+                stack.append(("block", (i2, j2, 1)))
+            stack.append(("range", (i1 + 1, i2, j1 + 1, j2)))
+
+    return blocks
+
+
+def opcodes(a: list, b: list) -> list[tuple[str, int, int, int, int]]:
+    """Get SequenceMatcher-style opcodes transforming one sequence into the other."""
+    codes = []
+    i = j = 0
+    for ai, bj, size in matching_blocks(a, b) + [(len(a), len(b), 0)]:
+        if i < ai and j < bj:
+            codes.append(("replace", i, ai, j, bj))
+        elif i < ai:
+            codes.append(("delete", i, ai, j, bj))
+        elif j < bj:
+            codes.append(("insert", i, ai, j, bj))
+        if size:
+            codes.append(("equal", ai, ai + size, bj, bj + size))
+        i, j = ai + size, bj + size
+    return codes
+
+
+def coalesce(spans: list[tuple[str, str | None]]) -> list[tuple[str, str | None]]:
+    """Merge adjacent spans with the same label, dropping empty spans."""
+    merged = []
+    for text, label in spans:
+        if not text:
+            continue
+        if merged and merged[-1][1] == label:
+            merged[-1] = (merged[-1][0] + text, label)
+        else:
+            merged.append((text, label))
+    return merged
+
+
+def diff_texts(
+    text_1: str, text_2: str, max_chars: int = DIFF_MAX_CHARS, max_word_tokens: int = DIFF_MAX_WORD_TOKENS
+) -> list[tuple[str, str | None]]:
+    """
+    Diff two texts line by line, refining changed lines word by word.
+
+    Args:
+    ----
+        text_1 (str): First text. Text only in this one is labeled "-".
+        text_2 (str): Second text. Text only in this one is labeled "+".
+        max_chars (int): Above this combined size, only diff by line.
+        max_word_tokens (int): Changed blocks with more word tokens than this are not refined word by word.
+
+    Returns:
+    -------
+        list[tuple[str, str | None]]: Coalesced (text, label) spans, with label None for unchanged text.
+
+    """
+    refine = len(text_1) + len(text_2) <= max_chars
+    lines_1 = text_1.splitlines(keepends=True)
+    lines_2 = text_2.splitlines(keepends=True)
+    spans = []
+    for tag, i1, i2, j1, j2 in opcodes(lines_1, lines_2):
+        block_1 = "".join(lines_1[i1:i2])
+        block_2 = "".join(lines_2[j1:j2])
+        if tag == "equal":
+            spans.append((block_1, None))
+            continue
+
+        words_1 = tokenize_words(block_1)
+        words_2 = tokenize_words(block_2)
+        if tag != "replace" or not refine or len(words_1) + len(words_2) > max_word_tokens:
+            spans += [(block_1, "-"), (block_2, "+")]
+            continue
+
+        for word_tag, k1, k2, l1, l2 in SequenceMatcher(None, words_1, words_2, autojunk=False).get_opcodes():
+            if word_tag == "equal":
+                spans.append(("".join(words_1[k1:k2]), None))
+            else:
+                spans += [("".join(words_1[k1:k2]), "-"), ("".join(words_2[l1:l2]), "+")]
+
+    return coalesce(spans)
+
+
+def _edit_count(tokens_1: list | str, tokens_2: list | str, max_tokens: int) -> int:
+    """Count the edits aligning two token sequences, approximating oversized blocks by their longer length."""
+    if len(tokens_1) + len(tokens_2) > max_tokens:
+        return max(len(tokens_1), len(tokens_2))
+    codes = SequenceMatcher(None, tokens_1, tokens_2, autojunk=False).get_opcodes()
+    return sum(max(i2 - i1, j2 - j1) for tag, i1, i2, j1, j2 in codes if tag != "equal")
+
+
+def error_rates(reference: str, hypothesis: str, max_word_tokens: int = DIFF_MAX_WORD_TOKENS) -> dict:
+    """
+    Compute the character and word error rates of a hypothesis text against a reference text.
+
+    Edits are counted on a line alignment, refined by word and then by character within changed
+    blocks, which approximates the edit distance in near-linear time on long documents.
+
+    Args:
+    ----
+        reference (str): Reference text.
+        hypothesis (str): Text to score.
+        max_word_tokens (int): Changed blocks larger than this are scored by their length instead of aligned.
+
+    Returns:
+    -------
+        dict: Character error rate ("cer") and word error rate ("wer").
+
+    """
+    lines_1 = reference.splitlines(keepends=True)
+    lines_2 = hypothesis.splitlines(keepends=True)
+    char_edits = 0
+    word_edits = 0
+    for tag, i1, i2, j1, j2 in opcodes(lines_1, lines_2):
+        if tag == "equal":
+            continue
+        block_1 = "".join(lines_1[i1:i2])
+        block_2 = "".join(lines_2[j1:j2])
+        word_edits += _edit_count(block_1.split(), block_2.split(), max_word_tokens)
+
+        # Count character edits within the changed words only
+        words_1 = tokenize_words(block_1)
+        words_2 = tokenize_words(block_2)
+        if len(words_1) + len(words_2) > max_word_tokens:
+            char_edits += max(len(block_1), len(block_2))
+            continue
+        for word_tag, k1, k2, l1, l2 in SequenceMatcher(None, words_1, words_2, autojunk=False).get_opcodes():
+            if word_tag != "equal":
+                char_edits += _edit_count("".join(words_1[k1:k2]), "".join(words_2[l1:l2]), max_word_tokens)
+
+    return {
+        "cer": char_edits / max(len(reference), 1),
+        "wer": word_edits / max(len(reference.split()), 1),
+    }
@@ -1,15 +1,28 @@
+import io
+import sys
 from base64 import b64encode
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from tempfile import NamedTemporaryFile
+from typing import Iterable, Iterator
 
 import requests
 from docling.datamodel.base_models import ConversionStatus
 from docling.document_converter import DocumentConverter
-from docling_core.types.doc.document import DoclingDocument, DocTagsDocument
+from docling_core.types.doc.document import DoclingDocument, DocTagsDocument, DocTagsPage
 from pydantic import BaseModel
 from PyPDF2 import PdfReader, PdfWriter
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from metadata_extraction_demo.utils import convert_pdf_to_images
+from metadata_extraction_demo.constants import DOCLING_MAX_RETRIES, DOCLING_MAX_WORKERS, DOCLING_PAGES_PER_REQUEST, DOCLING_TIMEOUT
+from metadata_extraction_demo.selective_ocr import classify_pages
+from metadata_extraction_demo.telemetry import span
+from metadata_extraction_demo.utils import drop_page_images, iter_blank_page_images
+
+DOCTAG_START = "<doctag>"
+DOCTAG_END = "</doctag>"
+PAGE_BREAK = "<page_break>"
 
 
 class PseudoConversionResult(BaseModel):
@@ -19,55 +32,149 @@ class PseudoConversionResult(BaseModel):
     status: ConversionStatus = ConversionStatus.SUCCESS
 
 
+def split_doctags_pages(doctags: str, num_pages: int) -> list[str]:
+    """Split a multi-page doctags string into one doctags string per page."""
+    if num_pages == 1:
+        return [doctags]
+    content = doctags.strip().removeprefix(DOCTAG_START).removesuffix(DOCTAG_END)
+    pages = content.split(PAGE_BREAK)
+    if len(pages) != num_pages:
+        raise ValueError(f"Expected {num_pages} pages of doctags, got {len(pages)}")
+    return [DOCTAG_START + page + DOCTAG_END for page in pages]
+
+
+def load_page_doctags(page_doctags: Iterable[str], page_images: Iterable, document_name: str) -> DoclingDocument:
+    """Load the doctags of each page into a document, holding one page image at a time."""
+    pages = (DocTagsPage(tokens=doctags, image=image) for doctags, image in zip(page_doctags, page_images, strict=True))
+    # load_from_doctags reads the pages once in order, so they are generated one at a time instead of being validated into a list
+    doctags_doc = DocTagsDocument.model_construct(pages=pages)
+    document = drop_page_images(DoclingDocument.load_from_doctags(doctags_doc, document_name=document_name))
+    # The page images are blank and only size the pages, so the pictures cropped from them are dropped too
+    for picture in document.pictures:
+        picture.image = None
+    return document
+
+
 class DoclingServerConverter(DocumentConverter):
     """Docling converter using docling-serve server."""
 
-    def __init__(self, base_url: str, api_key: str = None, addtl_ocr_options={}):
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str = None,
+        addtl_ocr_options={},
+        max_workers: int = DOCLING_MAX_WORKERS,
+        pages_per_request: int = DOCLING_PAGES_PER_REQUEST,
+        max_retries: int = DOCLING_MAX_RETRIES,
+        timeout: float = DOCLING_TIMEOUT,
+        selective_ocr: bool = False,
+    ):
         """Initialize."""
         self.base_url = base_url
         self.api_key = api_key
         self.addtl_ocr_options = addtl_ocr_options
-
-    def convert(self, path: Path, **kwargs) -> DoclingDocument:
-        """Convert a PDF to markdown using the Docling server."""
-        # Convert file to bytes
-        pdf_obj = open(path, "rb")
-        pdf = PdfReader(pdf_obj)
-        all_doctags = []
-        for page in pdf.pages:
-            page_pdf = PdfWriter()
-            page_pdf.add_page(page)
-            tmp = NamedTemporaryFile(suffix=".pdf")
-            with open(tmp.name, "wb") as f:
-                page_pdf.write(f)
-
-            # Convert bytes to base64 string
-            with open(tmp.name, "rb") as f:
-                b64_encoded_bytes = b64encode(f.read()).decode()
-
-            # Build request
-            ocr_options = self.addtl_ocr_options | {"to_formats": ["doctags"]}
-            json_body = {"options": ocr_options, "file_sources": [{"base64_string": b64_encoded_bytes, "filename": "pdf-to-convert.pdf"}]}
-            url = self.base_url + "/v1alpha/convert/source"
-            headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key is not None else {}
-
-            # Send the request
-            response = requests.post(url, json=json_body, headers=headers)
+        self.max_workers = max_workers
+        self.pages_per_request = pages_per_request
+        self.timeout = timeout
+        self.selective_ocr = selective_ocr
+
+        # Shared keep-alive session, retrying 5xx responses and timeouts with exponential backoff
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=0.5,
+            status_forcelist=[500, 502, 503, 504],
+            allowed_methods=None,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if api_key is not None:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def convert_pages(self, b64_encoded_bytes: str, num_pages: int, do_ocr: bool = True) -> list[str]:
+        """Convert a base64 encoded PDF chunk to one doctags string per page."""
+        # Build request
+        ocr_options = self.addtl_ocr_options | {"to_formats": ["doctags"]} | ({} if do_ocr else {"do_ocr": False})
+        json_body = {"options": ocr_options, "file_sources": [{"base64_string": b64_encoded_bytes, "filename": "pdf-to-convert.pdf"}]}
+        url = self.base_url + "/v1alpha/convert/source"
+
+        # Send the request
+        with span("docling_server.request", pages=num_pages, request_bytes=len(b64_encoded_bytes)) as request_span:
+            response = self.session.post(url, json=json_body, timeout=self.timeout)
+            request_span.set_attribute("http.status_code", response.status_code)
             response.raise_for_status()
-            if response.json()["status"] != "success":
-                raise Exception(f"Conversion failed with status {response.json()['status']}, errors {response.json()['errors']}")
-
-            # Extract the doctags
-            doctags = response.json()["document"]["doctags_content"]
-            all_doctags.append(doctags)
-
-        # Create the doctags document
-        images = convert_pdf_to_images(path=path)
-        doctags_doc = DocTagsDocument.from_doctags_and_image_pairs(all_doctags, images)
+            response_json = response.json()
+        if response_json["status"] != "success":
+            raise Exception(f"Conversion failed with status {response_json['status']}, errors {response_json['errors']}")
+
+        # Extract the doctags
+        doctags = response_json["document"]["doctags_content"]
+        return split_doctags_pages(doctags, num_pages)
+
+    def iter_chunks(self, path: Path, page_range: tuple[int, int] = (1, sys.maxsize)) -> Iterator[tuple[str, int, bool]]:
+        """
+        Split a range of pages of a PDF into base64 encoded chunks of pages, one chunk in memory at a time.
+
+        Yields the base64 encoded chunk, its number of pages, and whether it needs OCR. With selective OCR,
+        chunks never mix pages that need OCR with pages that have a usable text layer.
+        """
+        with open(path, "rb") as pdf_obj:
+            pdf = PdfReader(pdf_obj)
+            first_index, last_index = page_range[0] - 1, min(page_range[1], len(pdf.pages))
+            needs_ocr = classify_pages(path, page_range=page_range) if self.selective_ocr else [True] * (last_index - first_index)
+            start = first_index
+            while start < last_index:
+                # Extend the chunk up to pages_per_request pages with the same OCR need
+                end = start + 1
+                while (
+                    end < min(start + self.pages_per_request, last_index) and needs_ocr[end - first_index] == needs_ocr[start - first_index]
+                ):
+                    end += 1
+                chunk_pdf = PdfWriter()
+                chunk_pages = pdf.pages[start:end]
+                for page in chunk_pages:
+                    chunk_pdf.add_page(page)
+
+                # Write the chunk to memory and convert it to a base64 string
+                buffer = io.BytesIO()
+                chunk_pdf.write(buffer)
+                yield b64encode(buffer.getbuffer()).decode(), len(chunk_pages), needs_ocr[start - first_index]
+                start = end
+
+    def iter_page_doctags(self, path: Path, page_range: tuple[int, int] = (1, sys.maxsize)) -> Iterator[str]:
+        """Send the chunks of a PDF concurrently, yielding the doctags of each page in page order as soon as it is converted."""
+        # Keep at most max_workers chunks in flight
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque()
+            for chunk in self.iter_chunks(path, page_range=page_range):
+                if len(pending) >= self.max_workers:
+                    yield from pending.popleft().result()
+                pending.append(executor.submit(self.convert_pages, *chunk))
+            while pending:
+                yield from pending.popleft().result()
+
+    def iter_convert(self, path: Path, page_range: tuple[int, int] = (1, sys.maxsize), **kwargs) -> Iterator[PseudoConversionResult]:
+        """Convert a PDF using the Docling server, yielding one result per page in page order as soon as the page is converted."""
+        path = Path(path)
+        images = iter_blank_page_images(path, first_page=page_range[0], last_page=page_range[1])
+        for doctags, image in zip(self.iter_page_doctags(path, page_range=page_range), images, strict=True):
+            with span("docling_server.load_doctags", pages=1):
+                docling = load_page_doctags([doctags], [image], document_name=path.name)
+            yield PseudoConversionResult(document=docling)
+
+    def convert(self, path: Path, page_range: tuple[int, int] = (1, sys.maxsize), **kwargs) -> PseudoConversionResult:
+        """Convert a PDF to markdown using the Docling server."""
+        path = Path(path)
 
-        # Create a docling document
-        docling = DoclingDocument(name=path.name)
-        docling.load_from_doctags(doctags_doc)
+        # Create a docling document, loading each page as soon as it is converted. The pages are sized from the PDF
+        # instead of rendered, since the server exports images as placeholders.
+        images = iter_blank_page_images(path, first_page=page_range[0], last_page=page_range[1])
+        docling = load_page_doctags(self.iter_page_doctags(path, page_range=page_range), images, document_name=path.name)
 
         # Create a pseudo conversion result
         conversion_result = PseudoConversionResult(document=docling)
@@ -0,0 +1,65 @@
+import argparse
+import json
+import subprocess
+import sys
+
+from metadata_extraction_demo.constants import IMPORT_TIME_BUDGET
+
+# Modules the app imports at startup
+MODULES = [
+    "metadata_extraction_demo.constants",
+    "metadata_extraction_demo.telemetry",
+    "metadata_extraction_demo.utils",
+    "metadata_extraction_demo.cache",
+    "metadata_extraction_demo.convert",
+    "metadata_extraction_demo.pipeline",
+    "metadata_extraction_demo.pruning",
+    "metadata_extraction_demo.batch",
+]
+
+# Modules that must only be imported once a conversion method needs them
+DEFERRED_MODULES = ["torch", "docling", "docling_core.types.doc.document", "transformers", "easyocr"]
+
+MEASURE_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "deferred_imported": [m for m in {deferred!r} if m in sys.modules]}}))
+"""
+
+
+def measure_import(module: str, repeat: int = 3) -> dict:
+    """Measure the cold import time of a module in fresh interpreters, keeping the fastest run."""
+    runs = []
+    for _ in range(repeat):
+        script = MEASURE_SCRIPT.format(module=module, deferred=DEFERRED_MODULES)
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return min(runs, key=lambda run: run["seconds"])
+
+
+def main():
+    """Check that startup imports stay within the cold-start budget and don't pull in deferred modules."""
+    parser = argparse.ArgumentParser(description="Benchmark the import time of the application modules.")
+    parser.add_argument("--budget", type=float, default=IMPORT_TIME_BUDGET, help="Maximum import time in seconds for each module.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of cold imports per module.")
+    args = parser.parse_args()
+
+    failed = False
+    for module in MODULES:
+        result = measure_import(module, repeat=args.repeat)
+        problems = []
+        if result["seconds"] > args.budget:
+            problems.append(f"over budget of {args.budget:.2f}s")
+        if result["deferred_imported"]:
+            problems.append(f"eagerly imports {', '.join(result['deferred_imported'])}")
+        failed = failed or bool(problems)
+        status = "FAIL: " + "; ".join(problems) if problems else "ok"
+        print(f"{module:<45} {result['seconds']:>7.3f}s  {status}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
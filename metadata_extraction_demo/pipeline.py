@@ -1,12 +1,25 @@
+import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator
 
-from docling.datamodel.document import ConversionResult
-from docling.document_converter import DocumentConverter
-from openai import Client
+from openai import AsyncClient, Client
 from openai.types.chat import ParsedChatCompletion
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
+from PyPDF2 import PdfReader
 
-from metadata_extraction_demo.utils import openai_client
+from metadata_extraction_demo.cache import ConversionCache, ResponseCache
+from metadata_extraction_demo.chunking import ReconciliationRule, make_partial_model, merge_results, split_document, split_pages
+from metadata_extraction_demo.constants import CHUNK_MAX_CHARS, CHUNK_MAX_WORKERS, CHUNK_RECONCILIATION
+from metadata_extraction_demo.pruning import prune_text
+from metadata_extraction_demo.telemetry import record_llm_usage, span
+from metadata_extraction_demo.utils import get_json_schema, openai_async_client, openai_client
+
+if TYPE_CHECKING:
+    from docling.datamodel.document import ConversionResult
+    from docling.document_converter import DocumentConverter
+    from docling_core.types.doc.document import DoclingDocument
 
 logger = logging.getLogger(__name__)
 
@@ -15,22 +28,140 @@ class MetadataExtractionPipeline:
     """Pipeline class for metadata extraction from files."""
 
     def __init__(
-        self, converter: DocumentConverter, model: str, response_format: BaseModel, system_prompt: str = None, client: Client = None
+        self,
+        converter: "DocumentConverter",
+        model: str,
+        response_format: BaseModel,
+        system_prompt: str = None,
+        client: Client = None,
+        conversion_cache: ConversionCache = None,
+        cache_namespace: str = None,
+        async_client: AsyncClient = None,
+        response_cache: ResponseCache = None,
+        pages_per_conversion: int = 1,
     ):
-        """Initialize."""
+        """
+        Initialize.
+
+        Args:
+        ----
+            converter (DocumentConverter): Converter used to turn files into documents.
+            model (str): Name of the LLM used for extraction.
+            response_format (BaseModel): Pydantic model describing the metadata to extract.
+            system_prompt (str): Optional system prompt.
+            client (Client): OpenAI client. Defaults to `openai_client()`.
+            conversion_cache (ConversionCache): Optional cache of converted documents.
+            cache_namespace (str): Identifies the converter configuration in conversion cache keys. Required to use the cache.
+            async_client (AsyncClient): Async OpenAI client. Defaults to `openai_async_client()` on first async use.
+            response_cache (ResponseCache): Optional cache of parsed LLM responses.
+            pages_per_conversion (int): Number of PDF pages converted at once when streaming pages. Larger values save
+                per-conversion overhead at the cost of a later first page.
+
+        """
         self.converter = converter
         self.model = model
         self.response_format = response_format
         self.system_prompt = system_prompt
         self.client = openai_client() if client is None else client
+        self.conversion_cache = conversion_cache
+        self.cache_namespace = cache_namespace
+        self._async_client = async_client
+        self.response_cache = response_cache
+        self.pages_per_conversion = pages_per_conversion
+        self.pruning_stats: dict = None
+
+    @property
+    def async_client(self) -> AsyncClient:
+        """Async OpenAI client, created on first use."""
+        if self._async_client is None:
+            self._async_client = openai_async_client()
+        return self._async_client
+
+    def _conversion_cache_key(self, path: str, **kwargs) -> str | None:
+        """Build the conversion cache key for a file, or None if the conversion cache is disabled."""
+        if self.conversion_cache is None or self.cache_namespace is None:
+            return None
+        namespace = self.cache_namespace + (json.dumps(kwargs, sort_keys=True, default=str) if kwargs else "")
+        return self.conversion_cache.key(path, namespace=namespace)
+
+    def path_to_document(self, path: str, **kwargs) -> "DoclingDocument":
+        """Convert a file to a docling document using the converter, reusing cached conversions."""
+        cache_key = self._conversion_cache_key(path, **kwargs)
+        if cache_key is not None:
+            document = self.conversion_cache.get(cache_key)
+            if document is not None:
+                logger.info("Loaded converted document from cache")
+                return document
+
+        logger.info("Converting file to text")
+        with span("convert.document", converter=type(self.converter).__name__):
+            conversion_result: "ConversionResult" = self.converter.convert(path, **kwargs)
+        document = conversion_result.document
+
+        if cache_key is not None:
+            self.conversion_cache.put(cache_key, document)
+        return document
 
     def path_to_text(self, path: str, **kwargs):
         """Convert a file to text using the converter."""
-        logger.info("Converting file to text")
-        conversion_result: ConversionResult = self.converter.convert(path, **kwargs)
-        text = conversion_result.document.export_to_markdown()
+        document = self.path_to_document(path, **kwargs)
+        with span("convert.export_markdown"):
+            text = document.export_to_markdown()
         return text
 
+    def iter_path_to_pages(self, path: str, **kwargs) -> Iterator[str]:
+        """Convert a file to text page by page, yielding the markdown of each page as soon as it is converted."""
+        cache_key = self._conversion_cache_key(path, **kwargs)
+        if cache_key is not None:
+            pages = self.conversion_cache.get_pages(cache_key)
+            if pages is None and (document := self.conversion_cache.get(cache_key)) is not None:
+                pages = [document.export_to_markdown(page_no=page_no) for page_no in sorted(document.pages)] or [
+                    document.export_to_markdown()
+                ]
+            if pages is not None:
+                logger.info("Loaded converted document from cache")
+                yield from pages
+                return
+
+        # Only PDFs can be converted page by page
+        if Path(path).suffix.lower() != ".pdf":
+            yield self.path_to_text(path, **kwargs)
+            return
+
+        pages = []
+        for page_text in self._iter_converted_pages(path, **kwargs):
+            pages.append(page_text)
+            yield page_text
+
+        if cache_key is not None:
+            self.conversion_cache.put_pages(cache_key, pages)
+
+    def _iter_converted_pages(self, path: str, **kwargs) -> Iterator[str]:
+        """Convert a PDF page by page, yielding the markdown of each page."""
+        # Converters that stream pages themselves keep several pages in flight at once
+        iter_convert = getattr(self.converter, "iter_convert", None)
+        if iter_convert is not None:
+            for page_no, conversion_result in enumerate(iter_convert(path, **kwargs), start=1):
+                with span("convert.export_markdown", page_no=page_no):
+                    page_text = conversion_result.document.export_to_markdown()
+                yield page_text
+            return
+
+        with open(path, "rb") as f:
+            num_pages = len(PdfReader(f).pages)
+        for first_page in range(1, num_pages + 1, self.pages_per_conversion):
+            last_page = min(first_page + self.pages_per_conversion - 1, num_pages)
+            logger.info(f"Converting pages {first_page}-{last_page}/{num_pages} to text")
+            with span("convert.page", converter=type(self.converter).__name__, page_no=first_page, pages=last_page - first_page + 1):
+                conversion_result: "ConversionResult" = self.converter.convert(path, page_range=(first_page, last_page), **kwargs)
+            document = conversion_result.document
+            with span("convert.export_markdown", page_no=first_page):
+                if first_page == last_page:
+                    page_texts = [document.export_to_markdown()]
+                else:
+                    page_texts = [document.export_to_markdown(page_no=page_no) for page_no in sorted(document.pages)]
+            yield from page_texts
+
     def text_to_metadata(
         self,
         text: str,
@@ -38,25 +169,158 @@ class MetadataExtractionPipeline:
     ) -> BaseModel:
         """Extract structured metadata from text."""
         logger.info("Converting text to metadata")
-        # Construct and send the request to the LLM
+        # Construct the request and check the response cache
+        request = self._build_request(text, **kwargs)
+        cache_key = self._response_cache_key(request)
+        if cache_key is not None and (cached := self.response_cache.get(cache_key)) is not None:
+            logger.info("Loaded metadata from response cache")
+            return request["response_format"].model_validate_json(cached)
+
+        # Send the request to the LLM
+        with span("llm.extract", model=request["model"], input_chars=len(text)) as llm_span:
+            response: ParsedChatCompletion = self.client.beta.chat.completions.parse(**request)
+            record_llm_usage(llm_span, request["model"], response.usage)
+        metadata: BaseModel = response.choices[0].message.parsed
+        if cache_key is not None and metadata is not None:
+            self.response_cache.put(cache_key, model=self.model, value=metadata.model_dump_json())
+        return metadata
+
+    async def atext_to_metadata(
+        self,
+        text: str,
+        **kwargs,
+    ) -> BaseModel:
+        """Extract structured metadata from text using the async client."""
+        logger.info("Converting text to metadata")
+        request = self._build_request(text, **kwargs)
+        cache_key = self._response_cache_key(request)
+        if cache_key is not None and (cached := self.response_cache.get(cache_key)) is not None:
+            logger.info("Loaded metadata from response cache")
+            return request["response_format"].model_validate_json(cached)
+
+        with span("llm.extract", model=request["model"], input_chars=len(text)) as llm_span:
+            response: ParsedChatCompletion = await self.async_client.beta.chat.completions.parse(**request)
+            record_llm_usage(llm_span, request["model"], response.usage)
+        metadata: BaseModel = response.choices[0].message.parsed
+        if cache_key is not None and metadata is not None:
+            self.response_cache.put(cache_key, model=self.model, value=metadata.model_dump_json())
+        return metadata
+
+    def stream_text_to_metadata(
+        self,
+        text: str,
+        **kwargs,
+    ) -> Iterator[str]:
+        """Extract structured metadata from text, yielding the JSON generated so far as the LLM streams it."""
+        logger.info("Converting text to metadata")
+        request = self._build_request(text, **kwargs)
+        cache_key = self._response_cache_key(request)
+        if cache_key is not None and (cached := self.response_cache.get(cache_key)) is not None:
+            logger.info("Loaded metadata from response cache")
+            yield request["response_format"].model_validate_json(cached).model_dump_json(indent=2)
+            return
+
+        with span("llm.extract", detached=True, model=request["model"], input_chars=len(text), stream=True) as llm_span:
+            with self.client.beta.chat.completions.stream(**request) as stream:
+                for event in stream:
+                    if event.type == "content.delta":
+                        yield event.snapshot
+                completion: ParsedChatCompletion = stream.get_final_completion()
+            record_llm_usage(llm_span, request["model"], completion.usage)
+
+        metadata: BaseModel = completion.choices[0].message.parsed
+        if cache_key is not None and metadata is not None:
+            self.response_cache.put(cache_key, model=self.model, value=metadata.model_dump_json())
+        yield metadata.model_dump_json(indent=2)
+
+    def _response_cache_key(self, request: dict) -> str | None:
+        """Build the response cache key for a request, or None if the response cache is disabled."""
+        if self.response_cache is None:
+            return None
+        params = {name: value for name, value in request.items() if name != "response_format"}
+        return self.response_cache.key(params | {"response_format": get_json_schema(request["response_format"])})
+
+    def _build_request(self, text: str, **kwargs) -> dict:
+        """Build the chat completion request for extracting metadata from text."""
         system_messages = [{"role": "system", "content": self.system_prompt}] if self.system_prompt else []
         messages = system_messages + [{"role": "user", "content": text}]
-        response: ParsedChatCompletion = self.client.beta.chat.completions.parse(
-            messages=messages,
-            model=self.model,
-            response_format=self.response_format,
+        request = {
+            "messages": messages,
+            "model": self.model,
+            "response_format": self.response_format,
             # Added for compatibility with vLLM: https://docs.vllm.ai/en/latest/features/structured_outputs.html
-            extra_body={"guided_decoding_backend": "outlines"},
-            **kwargs,
-        )
-        metadata: BaseModel = response.choices[0].message.parsed
+            "extra_body": {"guided_decoding_backend": "outlines"},
+        }
+        return request | kwargs
+
+    def chunked_document_to_metadata(
+        self,
+        document: "DoclingDocument",
+        max_chars: int = CHUNK_MAX_CHARS,
+        reconciliation: ReconciliationRule = CHUNK_RECONCILIATION,
+        max_workers: int = CHUNK_MAX_WORKERS,
+        **kwargs,
+    ) -> BaseModel:
+        """Extract structured metadata from each chunk of a document concurrently and merge the partial results."""
+        chunks = split_document(document, max_chars=max_chars)
+        return self.chunks_to_metadata(chunks, reconciliation=reconciliation, max_workers=max_workers, **kwargs)
+
+    def chunked_pages_to_metadata(
+        self,
+        pages: list[str],
+        max_chars: int = CHUNK_MAX_CHARS,
+        reconciliation: ReconciliationRule = CHUNK_RECONCILIATION,
+        max_workers: int = CHUNK_MAX_WORKERS,
+        **kwargs,
+    ) -> BaseModel:
+        """Extract structured metadata from chunks of the markdown of each page concurrently and merge the partial results."""
+        chunks = split_pages(pages, max_chars=max_chars)
+        return self.chunks_to_metadata(chunks, reconciliation=reconciliation, max_workers=max_workers, **kwargs)
+
+    def chunks_to_metadata(
+        self,
+        chunks: list[str],
+        reconciliation: ReconciliationRule = CHUNK_RECONCILIATION,
+        max_workers: int = CHUNK_MAX_WORKERS,
+        **kwargs,
+    ) -> BaseModel:
+        """Extract structured metadata from text chunks concurrently and merge the partial results."""
+        logger.info(f"Extracting metadata from {len(chunks)} chunks")
+        partial_format = make_partial_model(self.response_format)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            partials = list(executor.map(lambda chunk: self.text_to_metadata(text=chunk, response_format=partial_format, **kwargs), chunks))
+
+        merged = merge_results([partial.model_dump(mode="json") for partial in partials], rule=reconciliation)
+        try:
+            metadata = self.response_format.model_validate(merged)
+        except ValidationError:
+            missing = [field for field, value in merged.items() if value is None]
+            logger.warning(f"No chunk contained a value for {missing}, returning partial metadata")
+            metadata = partial_format.model_validate(merged)
         return metadata
 
-    def extract(self, path: str, convert_kwargs: dict = {}, llm_kwargs: dict = {}):
+    def extract(
+        self,
+        path: str,
+        convert_kwargs: dict = {},
+        llm_kwargs: dict = {},
+        chunked: bool = False,
+        chunk_kwargs: dict = {},
+        prune: bool = False,
+        prune_kwargs: dict = {},
+    ):
         """Execute the pipeline."""
         # Extract text
-        text = self.path_to_text(path=path, **convert_kwargs)
+        document = self.path_to_document(path=path, **convert_kwargs)
+        with span("convert.export_markdown"):
+            text = document.export_to_markdown()
 
         # Extract metadata
-        metadata = self.text_to_metadata(text=text, **llm_kwargs)
+        if chunked:
+            metadata = self.chunked_document_to_metadata(document=document, **chunk_kwargs, **llm_kwargs)
+        elif prune:
+            pruned_text, self.pruning_stats = prune_text(text, response_format=self.response_format, **prune_kwargs)
+            metadata = self.text_to_metadata(text=pruned_text, **llm_kwargs)
+        else:
+            metadata = self.text_to_metadata(text=text, **llm_kwargs)
         return metadata, text
@@ -0,0 +1,140 @@
+import logging
+import math
+import re
+from collections import Counter
+
+from pydantic import BaseModel
+
+from metadata_extraction_demo.chunking import group_sections, split_markdown_sections
+from metadata_extraction_demo.constants import PRUNE_SECTION_MAX_CHARS, PRUNE_TOKEN_BUDGET, PRUNE_TOP_K
+from metadata_extraction_demo.utils import get_json_schema
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Split text into lowercase alphanumeric terms."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the number of LLM tokens in a text."""
+    return math.ceil(len(text) / 4)
+
+
+def _node_terms(node: dict) -> list[str]:
+    """Get the query terms of a single JSON schema node: its field names, description, title and enum options."""
+    terms = []
+    for name in node.get("properties", {}):
+        terms.extend(tokenize(name.replace("_", " ")))
+    for key in ("description", "title"):
+        if isinstance(node.get(key), str):
+            terms.extend(tokenize(node[key]))
+    for option in node.get("enum", []):
+        terms.extend(tokenize(str(option)))
+    return terms
+
+
+def schema_terms(response_format: type[BaseModel]) -> list[str]:
+    """Collect query terms from the field names, descriptions and enum options of a model's JSON schema."""
+    terms = []
+
+    def walk(node):
+        if isinstance(node, dict):
+            terms.extend(_node_terms(node))
+            for value in node.get("properties", {}).values():
+                walk(value)
+            for key, value in node.items():
+                if key not in ("properties", "enum"):
+                    walk(value)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item)
+
+    walk(get_json_schema(response_format))
+    return terms
+
+
+class BM25:
+    """Okapi BM25 index over a small set of documents."""
+
+    def __init__(self, documents: list[list[str]], k1: float = 1.5, b: float = 0.75):
+        """Initialize."""
+        self.k1 = k1
+        self.b = b
+        self.term_counts = [Counter(document) for document in documents]
+        self.lengths = [len(document) for document in documents]
+        self.average_length = sum(self.lengths) / len(documents) if documents else 0
+        document_frequency = Counter(term for counts in self.term_counts for term in counts)
+        n = len(documents)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()}
+
+    def scores(self, query: list[str]) -> list[float]:
+        """Score every document against a query."""
+        query_counts = Counter(query)
+        scores = []
+        for counts, length in zip(self.term_counts, self.lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / self.average_length) if self.average_length else self.k1
+            for term, weight in query_counts.items():
+                tf = counts.get(term, 0)
+                if tf:
+                    score += weight * self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            scores.append(score)
+        return scores
+
+
+def prune_text(
+    text: str,
+    response_format: type[BaseModel],
+    top_k: int = PRUNE_TOP_K,
+    token_budget: int = PRUNE_TOKEN_BUDGET,
+    section_max_chars: int = PRUNE_SECTION_MAX_CHARS,
+) -> tuple[str, dict]:
+    """
+    Keep only the sections of a markdown text most relevant to the fields of a model.
+
+    Args:
+    ----
+        text (str): Markdown text to prune.
+        response_format (BaseModel): Pydantic model describing the metadata to extract.
+        top_k (int): Maximum number of sections to keep.
+        token_budget (int): Maximum estimated tokens to keep.
+        section_max_chars (int): Sections longer than this are split into paragraph groups before scoring.
+
+    Returns:
+    -------
+        tuple[str, dict]: Pruned text, with the kept sections in document order, and pruning statistics.
+
+    """
+    sections = []
+    for section in split_markdown_sections(text):
+        sections += [section] if len(section) <= section_max_chars else group_sections(section.split("\n\n"), section_max_chars)
+
+    index = BM25([tokenize(section) for section in sections])
+    scores = index.scores(schema_terms(response_format))
+    ranked = sorted(range(len(sections)), key=lambda i: scores[i], reverse=True)
+
+    kept = []
+    used_tokens = 0
+    for i in ranked[:top_k]:
+        section_tokens = estimate_tokens(sections[i])
+        if kept and used_tokens + section_tokens > token_budget:
+            continue
+        kept.append(i)
+        used_tokens += section_tokens
+
+    pruned_text = "\n\n".join(sections[i] for i in sorted(kept))
+    tokens_before = estimate_tokens(text)
+    tokens_after = estimate_tokens(pruned_text)
+    stats = {
+        "sections_total": len(sections),
+        "sections_kept": len(kept),
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": max(tokens_before - tokens_after, 0),
+    }
+    logger.info(f"Pruned context from {tokens_before} to {tokens_after} estimated tokens ({len(kept)}/{len(sections)} sections kept)")
+    return pruned_text, stats
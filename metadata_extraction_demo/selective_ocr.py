@@ -0,0 +1,194 @@
+import logging
+import re
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator
+
+from PyPDF2 import PdfReader
+
+from metadata_extraction_demo.constants import (
+    SELECTIVE_OCR_MAX_IMAGE_COVERAGE,
+    SELECTIVE_OCR_MIN_CHARS,
+    SELECTIVE_OCR_MIN_DENSITY,
+    SELECTIVE_OCR_MIN_QUALITY,
+)
+from metadata_extraction_demo.telemetry import span
+from metadata_extraction_demo.utils import iter_blank_page_images
+
+if TYPE_CHECKING:
+    from docling.datamodel.base_models import InputFormat
+    from docling.document_converter import DocumentConverter
+
+logger = logging.getLogger(__name__)
+
+# Glyphs that could not be mapped to text, as extracted from PDFs with broken font encodings
+UNMAPPED_GLYPH_PATTERN = re.compile(r"\(cid:\d+\)|\ufffd|[\ue000-\uf8ff]")
+
+POINTS_PER_SQUARE_INCH = 72 * 72
+LETTER_PAGE_AREA = 612 * 792
+
+
+def text_layer_quality(text: str) -> dict:
+    """
+    Score the embedded text layer of a page.
+
+    Args:
+    ----
+        text (str): Text extracted from the page's text layer.
+
+    Returns:
+    -------
+        dict: Number of non-whitespace characters ("chars"), the fraction of characters that are not
+            unmapped glyphs or control characters ("char_quality"), and the fraction of words that
+            contain a letter or digit ("word_quality").
+
+    """
+    unmapped_chars = sum(len(match) for match in UNMAPPED_GLYPH_PATTERN.findall(text))
+    chars = [char for char in text if not char.isspace()]
+    control_chars = sum(1 for char in chars if not char.isprintable())
+    words = text.split()
+    return {
+        "chars": len(chars),
+        "char_quality": 1 - (unmapped_chars + control_chars) / len(chars) if chars else 0.0,
+        "word_quality": sum(1 for word in words if any(char.isalnum() for char in word)) / len(words) if words else 0.0,
+    }
+
+
+def page_needs_ocr(
+    text: str,
+    image_coverage: float = 0.0,
+    page_area: float = LETTER_PAGE_AREA,
+    min_chars: int = SELECTIVE_OCR_MIN_CHARS,
+    min_quality: float = SELECTIVE_OCR_MIN_QUALITY,
+    max_image_coverage: float = SELECTIVE_OCR_MAX_IMAGE_COVERAGE,
+    min_density: float = SELECTIVE_OCR_MIN_DENSITY,
+) -> bool:
+    """
+    Check whether a page's text layer is missing, too sparse or too garbled to use instead of OCR.
+
+    Args:
+    ----
+        text (str): Text extracted from the page's text layer.
+        image_coverage (float): Fraction of the page covered by images.
+        page_area (float): Area of the page in square points.
+        min_chars (int): Minimum number of non-whitespace characters.
+        min_quality (float): Minimum fraction of readable characters and words.
+        max_image_coverage (float): Image coverage above which the text layer must be at least min_density.
+        min_density (float): Minimum characters per square inch of a page mostly covered by images.
+
+    Returns:
+    -------
+        bool: Whether the page needs OCR.
+
+    """
+    quality = text_layer_quality(text)
+    if quality["chars"] < min_chars or quality["char_quality"] < min_quality or quality["word_quality"] < min_quality:
+        return True
+    # A scan with a typed header, footer or Bates stamp has a clean but sparse text layer over a page-sized image
+    density = quality["chars"] / (page_area / POINTS_PER_SQUARE_INCH)
+    return image_coverage > max_image_coverage and density < min_density
+
+
+def read_page(page) -> tuple[str, float, float]:
+    """Extract the text layer of a PyPDF2 page, the fraction of the page covered by images and the page area."""
+    resources = page["/Resources"] if "/Resources" in page else {}
+    xobjects = resources["/XObject"] if "/XObject" in resources else {}
+    image_names = {name for name in xobjects if xobjects[name].get("/Subtype") == "/Image"}
+
+    # Images are drawn in the unit square, so the area of each one is the determinant of the transformation matrix it is drawn with
+    image_area = 0.0
+
+    def visit(operator: bytes, operands: list, cm: list, tm: list):
+        nonlocal image_area
+        if operator == b"INLINE IMAGE" or (operator == b"Do" and operands and operands[0] in image_names):
+            image_area += abs(cm[0] * cm[3] - cm[1] * cm[2])
+
+    text = page.extract_text(visitor_operand_before=visit) or ""
+    page_area = float(page.mediabox.width) * float(page.mediabox.height) or LETTER_PAGE_AREA
+    return text, min(image_area / page_area, 1.0), page_area
+
+
+def classify_pages(path: Path, page_range: tuple[int, int] = (1, sys.maxsize), **kwargs) -> list[bool]:
+    """Check which pages of a PDF need OCR, in page order. Keyword arguments are passed to `page_needs_ocr`."""
+    with span("selective_ocr.classify"), open(path, "rb") as f:
+        pdf = PdfReader(f)
+        pages = pdf.pages[page_range[0] - 1 : min(page_range[1], len(pdf.pages))]
+        needs_ocr = []
+        for page in pages:
+            text, image_coverage, page_area = read_page(page)
+            needs_ocr.append(page_needs_ocr(text, image_coverage=image_coverage, page_area=page_area, **kwargs))
+    logger.info(f"{sum(needs_ocr)} of {len(needs_ocr)} pages need OCR")
+    return needs_ocr
+
+
+def page_runs(needs_ocr: list[bool], first_page: int = 1) -> list[tuple[bool, int, int]]:
+    """Group consecutive pages with the same OCR need into (needs_ocr, first_page, last_page) runs."""
+    runs = []
+    for page_no, page_needs in enumerate(needs_ocr, start=first_page):
+        if runs and runs[-1][0] == page_needs:
+            runs[-1] = (page_needs, runs[-1][1], page_no)
+        else:
+            runs.append((page_needs, page_no, page_no))
+    return runs
+
+
+class SelectiveOcrConverter:
+    """Converter that only runs OCR on the pages of a PDF without a usable text layer."""
+
+    def __init__(self, ocr_converter: "DocumentConverter", text_converter: "DocumentConverter"):
+        """
+        Initialize.
+
+        Args:
+        ----
+            ocr_converter (DocumentConverter): Converter for scanned pages and non-PDF files.
+            text_converter (DocumentConverter): Converter with OCR disabled, for pages with a usable text layer.
+
+        """
+        self.ocr_converter = ocr_converter
+        self.text_converter = text_converter
+
+    def initialize_pipeline(self, format: "InputFormat"):
+        """Initialize the pipelines of both converters."""
+        self.ocr_converter.initialize_pipeline(format)
+        self.text_converter.initialize_pipeline(format)
+
+    def convert(self, source, page_range: tuple[int, int] = (1, sys.maxsize), **kwargs):
+        """Convert a file, routing each run of PDF pages to the OCR or the text layer converter."""
+        path = Path(source)
+        if path.suffix.lower() != ".pdf":
+            return self.ocr_converter.convert(source, page_range=page_range, **kwargs)
+
+        runs = page_runs(classify_pages(path, page_range=page_range), first_page=page_range[0])
+        if len(runs) <= 1:
+            converter = self.ocr_converter if not runs or runs[0][0] else self.text_converter
+            return converter.convert(source, page_range=page_range, **kwargs)
+
+        # Convert each run with its converter and merge the pages back into one document through doctags
+        from metadata_extraction_demo.docling_server import PseudoConversionResult, load_page_doctags
+
+        images = iter_blank_page_images(path, first_page=page_range[0], last_page=runs[-1][2])
+        with span("selective_ocr.merge", pages=runs[-1][2] - page_range[0] + 1):
+            document = load_page_doctags(self._iter_page_doctags(runs, source, **kwargs), images, document_name=path.name)
+        return PseudoConversionResult(document=document)
+
+    def _iter_page_doctags(self, runs: list[tuple[bool, int, int]], source, **kwargs) -> Iterator[str]:
+        """Convert the runs in order, yielding the doctags of each page."""
+        for run_needs_ocr, first_page, last_page in runs:
+            converter = self.ocr_converter if run_needs_ocr else self.text_converter
+            yield from self._convert_run(converter, source, first_page, last_page, **kwargs)
+
+    def _convert_run(self, converter: "DocumentConverter", source, first_page: int, last_page: int, **kwargs) -> list[str]:
+        """Convert a run of pages at once, returning the doctags of each page."""
+        from metadata_extraction_demo.docling_server import split_doctags_pages
+
+        conversion_result = converter.convert(source, page_range=(first_page, last_page), **kwargs)
+        try:
+            return split_doctags_pages(conversion_result.document.export_to_doctags(), last_page - first_page + 1)
+        except ValueError:
+            # Blank pages at the start or end of a run have no page break, so convert those runs page by page instead
+            logger.info(f"Could not split pages {first_page}-{last_page} by page break, converting them one page at a time")
+            return [
+                converter.convert(source, page_range=(page_no, page_no), **kwargs).document.export_to_doctags()
+                for page_no in range(first_page, last_page + 1)
+            ]
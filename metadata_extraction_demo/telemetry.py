@@ -0,0 +1,186 @@
+import logging
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Iterator
+
+from metadata_extraction_demo.constants import METRICS_PORT, TRACELOOP_BASE_URL, TRACELOOP_DISABLE_BATCH
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "metadata-extraction-demo"
+
+
+class NoopSpan:
+    """Stand-in for a span when tracing is disabled."""
+
+    def set_attribute(self, key: str, value):
+        """Ignore an attribute."""
+
+    def set_attributes(self, attributes: dict):
+        """Ignore attributes."""
+
+
+NOOP_SPAN = NoopSpan()
+_NOOP_CONTEXT = nullcontext(NOOP_SPAN)
+
+
+def _setup_tracer():
+    """Create an OpenTelemetry tracer exporting to TRACELOOP_BASE_URL, or None if tracing is disabled or unavailable."""
+    if TRACELOOP_BASE_URL is None:
+        return None
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor
+    except ImportError:
+        logger.warning("TRACELOOP_BASE_URL is set but OpenTelemetry is not installed, install the telemetry extra to enable tracing")
+        return None
+
+    exporter = OTLPSpanExporter(endpoint=TRACELOOP_BASE_URL.rstrip("/") + "/v1/traces")
+    provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+    provider.add_span_processor(SimpleSpanProcessor(exporter) if TRACELOOP_DISABLE_BATCH else BatchSpanProcessor(exporter))
+    return provider.get_tracer(__name__)
+
+
+# Caches whose stats() counters are exported as metrics, by name
+_caches: dict = {}
+
+
+class CacheCollector:
+    """Prometheus collector reading the counters of the registered caches when the metrics are scraped."""
+
+    def collect(self):
+        """Yield the cache counters."""
+        from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+        events = CounterMetricFamily(
+            "metadata_extraction_cache_events", "Cache hits, misses, evictions and expirations.", labels=["cache", "event"]
+        )
+        entries = GaugeMetricFamily("metadata_extraction_cache_entries", "Entries held in memory by each cache.", labels=["cache"])
+        for name, cache in _caches.items():
+            for event, count in cache.stats().items():
+                if event == "size":
+                    entries.add_metric([name], count)
+                else:
+                    events.add_metric([name, event], count)
+        yield events
+        yield entries
+
+
+def register_cache(name: str, cache):
+    """Export the counters returned by a cache's stats() as metrics."""
+    if cache is not None:
+        _caches[name] = cache
+
+
+def _setup_metrics():
+    """Create the Prometheus metrics, or None if metrics are disabled or unavailable."""
+    if not METRICS_PORT:
+        return None
+    try:
+        from prometheus_client import REGISTRY, Counter, Histogram
+    except ImportError:
+        logger.warning("METRICS_PORT is set but prometheus_client is not installed, install the telemetry extra to enable metrics")
+        return None
+
+    REGISTRY.register(CacheCollector())
+    return {
+        "stage_seconds": Histogram("metadata_extraction_stage_seconds", "Time spent in each pipeline stage.", ["stage"]),
+        "stage_errors": Counter("metadata_extraction_stage_errors", "Errors raised in each pipeline stage.", ["stage"]),
+        "llm_tokens": Counter("metadata_extraction_llm_tokens", "Tokens used by LLM calls.", ["model", "kind"]),
+    }
+
+
+_tracer = _setup_tracer()
+_metrics = _setup_metrics()
+ENABLED = _tracer is not None or _metrics is not None
+_metrics_server_started = False
+
+
+def start_metrics_server():
+    """
+    Serve the metrics on METRICS_PORT, if metrics are enabled.
+
+    Call this from entry points in the main process only. Spawned worker processes import this module too,
+    and would fail to bind the same port.
+    """
+    global _metrics_server_started
+    if _metrics is None or _metrics_server_started:
+        return
+    from prometheus_client import start_http_server
+
+    start_http_server(METRICS_PORT)
+    _metrics_server_started = True
+    logger.info(f"Serving metrics on port {METRICS_PORT}")
+
+
+def _attribute_value(value):
+    """Convert a value to a type OpenTelemetry accepts as an attribute."""
+    return value if isinstance(value, (str, bool, int, float)) else str(value)
+
+
+def span(name: str, detached: bool = False, **attributes):
+    """
+    Time a pipeline stage as a span and a metric.
+
+    Returns a shared no-op context when neither tracing nor metrics are enabled, so instrumentation costs nothing by default.
+
+    Args:
+    ----
+        name (str): Stage name, e.g. "convert.page".
+        detached (bool): Don't make the span current. Use this when the span wraps a `yield`, since a generator
+            may be resumed in another thread where the span's context cannot be detached.
+        **attributes: Span attributes. None values are dropped.
+
+    Returns:
+    -------
+        ContextManager: Context yielding the span, which supports `set_attribute`.
+
+    """
+    if not ENABLED:
+        return _NOOP_CONTEXT
+    return _instrumented_span(name, detached, {key: _attribute_value(value) for key, value in attributes.items() if value is not None})
+
+
+@contextmanager
+def _instrumented_span(name: str, detached: bool, attributes: dict) -> Iterator:
+    start = time.perf_counter()
+    try:
+        if _tracer is None:
+            yield NOOP_SPAN
+        elif detached:
+            current_span = _tracer.start_span(name, attributes=attributes)
+            try:
+                yield current_span
+            except Exception as e:
+                current_span.record_exception(e)
+                raise
+            finally:
+                current_span.end()
+        else:
+            with _tracer.start_as_current_span(name, attributes=attributes) as current_span:
+                yield current_span
+    except Exception:
+        if _metrics is not None:
+            _metrics["stage_errors"].labels(stage=name).inc()
+        raise
+    finally:
+        if _metrics is not None:
+            _metrics["stage_seconds"].labels(stage=name).observe(time.perf_counter() - start)
+
+
+def record_llm_usage(current_span, model: str, usage):
+    """Record the prompt and completion tokens of an LLM response on a span and in the token metrics."""
+    if not ENABLED or usage is None:
+        return
+    current_span.set_attributes(
+        {
+            "gen_ai.request.model": model,
+            "gen_ai.usage.prompt_tokens": usage.prompt_tokens,
+            "gen_ai.usage.completion_tokens": usage.completion_tokens,
+        }
+    )
+    if _metrics is not None:
+        _metrics["llm_tokens"].labels(model=model, kind="prompt").inc(usage.prompt_tokens)
+        _metrics["llm_tokens"].labels(model=model, kind="completion").inc(usage.completion_tokens)
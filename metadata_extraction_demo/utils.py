@@ -1,15 +1,33 @@
 import io
+import json
+import logging
+import threading
+import time
 from enum import Enum
+from functools import lru_cache
 from pathlib import Path
-from typing import List
+from typing import TYPE_CHECKING, Iterator, List
 
 import httpx
 import yaml
 from openai import AsyncClient, Client
-from pdf2image import convert_from_bytes
-from pydantic import BaseModel, create_model
+from pydantic import BaseModel, Field, create_model
+from PyPDF2 import PdfReader
 
-from metadata_extraction_demo.constants import OPENAI_API_KEY, OPENAI_BASE_URL, OPENAI_IGNORE_SSL
+from metadata_extraction_demo.constants import (
+    MODEL_LIST_TIMEOUT,
+    MODEL_LIST_TTL,
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    OPENAI_IGNORE_SSL,
+    SCHEMA_CACHE_SIZE,
+)
+from metadata_extraction_demo.telemetry import span
+
+if TYPE_CHECKING:
+    from docling_core.types.doc.document import DoclingDocument
+
+logger = logging.getLogger(__name__)
 
 type_mapper = {
     "str": str,
@@ -38,14 +56,55 @@ def openai_async_client():
     return client
 
 
-def get_models():
+def get_models(timeout: float = None):
     """Get available models on the OpenAI client."""
     client = openai_client()
+    if timeout is not None:
+        client = client.with_options(timeout=timeout, max_retries=0)
     response = client.models.list()
     models = [model.id for model in response.data]
     return sorted(models)
 
 
+class ModelCatalog:
+    """Cached list of available models, fetched in the background so a slow LLM endpoint never blocks the caller."""
+
+    def __init__(self, ttl: float = MODEL_LIST_TTL, timeout: float = MODEL_LIST_TIMEOUT):
+        """Initialize."""
+        self.ttl = ttl
+        self.timeout = timeout
+        self.models: list[str] = []
+        self.updated_at: float = None
+        self._loaded = threading.Event()
+        self._refreshing = threading.Lock()
+
+    def refresh(self) -> list[str]:
+        """Fetch the model list, keeping the previous list if the endpoint fails."""
+        if not self._refreshing.acquire(blocking=False):
+            # Another refresh is already running
+            return self.models
+        try:
+            self.models = get_models(timeout=self.timeout)
+            self.updated_at = time.monotonic()
+        except Exception:
+            logger.exception("Failed to list models")
+        finally:
+            self._loaded.set()
+            self._refreshing.release()
+        return self.models
+
+    def refresh_in_background(self):
+        """Fetch the model list in a background thread."""
+        threading.Thread(target=self.refresh, daemon=True).start()
+
+    def get(self, wait: float = 0) -> list[str]:
+        """Get the cached model list, waiting up to `wait` seconds for the first fetch and refreshing it when stale."""
+        self._loaded.wait(timeout=wait)
+        if self.updated_at is None or time.monotonic() - self.updated_at > self.ttl:
+            self.refresh_in_background()
+        return self.models
+
+
 def has_ocrmac():
     """Check if the system has ocrmac installed."""
     try:
@@ -72,49 +131,81 @@ def build_model_from_dict(d: dict, model_name: str) -> BaseModel:
     for attribute in d:
         attribute_info = d[attribute]
         if attribute_info["type"] == "object":
-            model[attribute] = (build_model_from_dict(attribute_info["properties"], attribute), ...)
+            field_type = build_model_from_dict(attribute_info["properties"], attribute)
         elif attribute_info["type"] == "array":
             if attribute_info["items"] == "object":
-                model[attribute] = (List[build_model_from_dict(attribute_info["properties"], attribute + "_item")], ...)
+                field_type = List[build_model_from_dict(attribute_info["properties"], attribute + "_item")]
             else:
-                model[attribute] = (List[type_mapper[attribute_info["items"]]], ...)  # noqa: F821
+                field_type = List[type_mapper[attribute_info["items"]]]  # noqa: F821
         elif attribute_info["type"] == "enum":
             enum_options = {opt.lower().replace(" ", "_"): opt for opt in attribute_info["options"]}
-            model[attribute] = (Enum(attribute, enum_options), ...)
+            field_type = Enum(attribute, enum_options)
         elif attribute_info["type"] in type_mapper:
-            model[attribute] = (type_mapper[attribute_info["type"]], ...)
+            field_type = type_mapper[attribute_info["type"]]
         else:
             raise ValueError(f"Unknown type: {attribute_info['type']}")
+        model[attribute] = (field_type, Field(..., description=attribute_info.get("description")))
 
     model = create_model(model_name, **model)
     return model
 
 
 def build_model_from_yaml(string: str):
-    """Build a pydantic model from YAML."""
+    """Build a pydantic model from YAML, reusing the model built for any previous YAML with the same content."""
     yaml_dict = yaml.safe_load(io.StringIO(string))
-    metadata_model = build_model_from_dict(d=yaml_dict, model_name="Metadata")
+    # Normalize away formatting and comments, keeping key order since it defines the field order
+    normalized = json.dumps(yaml_dict)
+    return _build_model_from_normalized_yaml(normalized)
+
+
+@lru_cache(maxsize=SCHEMA_CACHE_SIZE)
+def _build_model_from_normalized_yaml(normalized: str):
+    """Build a pydantic model from normalized YAML content."""
+    with span("schema.build"):
+        metadata_model = build_model_from_dict(d=json.loads(normalized), model_name="Metadata")
+        # Precompute the JSON schema alongside the model
+        get_json_schema(metadata_model)
     return metadata_model
 
 
-def convert_pdf_to_images(path: Path, **kwargs) -> List:
+@lru_cache(maxsize=SCHEMA_CACHE_SIZE)
+def get_json_schema(model: type[BaseModel]) -> dict:
+    """Get the JSON schema of a pydantic model, computed once per model class."""
+    return model.model_json_schema()
+
+
+def drop_page_images(document: "DoclingDocument") -> "DoclingDocument":
+    """Drop the page images of a document in place, so they are not kept in memory or written to the conversion cache."""
+    for page in document.pages.values():
+        page.image = None
+    return document
+
+
+def iter_blank_page_images(path: Path, first_page: int = 1, last_page: int = None) -> Iterator:
     """
-    Convert a PDF to an image.
+    Lazily create blank images the size of the pages of a PDF in points, without rendering the PDF.
+
+    Doctags locations are relative to the page, so loading doctags with these images sizes the pages and bounding
+    boxes of the document as if it was converted from the PDF.
 
     Args:
     ----
-        path (Path): Path to PDF file to convert.
-        kwargs: Keyword arguments to pass to `convert_from_bytes`.
+        path (Path): Path to the PDF file.
+        first_page (int): First page, starting at 1.
+        last_page (int): Last page, inclusive. Defaults to the last page of the PDF.
 
-    Returns:
-    -------
-        list[Image]: List of PDF images, one for each page.
+    Yields:
+    ------
+        Image: Blank 1-bit image, one for each page.
 
     """
-    # Convert the PDF to bytes if it isn't already
-    pdf = path.read_bytes()
-
-    # Convert the pdf to images
-    pdf_images = convert_from_bytes(pdf, **kwargs)
-
-    return pdf_images
+    from PIL import Image
+
+    with open(path, "rb") as pdf_obj:
+        pdf = PdfReader(pdf_obj)
+        last_page = len(pdf.pages) if last_page is None else min(last_page, len(pdf.pages))
+        for page in pdf.pages[first_page - 1 : last_page]:
+            width, height = round(float(page.cropbox.width)), round(float(page.cropbox.height))
+            if page.rotation % 180:
+                width, height = height, width
+            yield Image.new("1", (width, height))
@@ -0,0 +1,92 @@
+import logging
+import time
+from typing import Iterable, Iterator
+
+from docling.datamodel.base_models import Page, VlmPrediction
+from docling.datamodel.document import ConversionResult
+from docling.datamodel.pipeline_options import VlmPipelineOptions
+from docling.models.hf_vlm_model import HuggingFaceVlmModel
+from docling.pipeline.vlm_pipeline import VlmPipeline
+from docling.utils.profiling import TimeRecorder
+
+from metadata_extraction_demo.constants import VLM_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class BatchedVlmModel:
+    """Page model generating the doctags of several pages with one call to a loaded HuggingFace VLM."""
+
+    def __init__(self, model: HuggingFaceVlmModel, batch_size: int = VLM_BATCH_SIZE):
+        """
+        Initialize.
+
+        Args:
+        ----
+            model (HuggingFaceVlmModel): Docling's VLM model, whose weights and processor are reused.
+            batch_size (int): Maximum number of pages generated together.
+
+        """
+        self.model = model
+        self.batch_size = batch_size
+        # Pad the prompts on the left, so the generated tokens of every page start at the same position
+        self.model.processor.tokenizer.padding_side = "left"
+        eos_token_id = self.model.vlm_model.generation_config.eos_token_id
+        self.eos_token_ids = set(eos_token_id if isinstance(eos_token_id, list) else [eos_token_id])
+
+    def __call__(self, conv_res: ConversionResult, page_batch: Iterable[Page]) -> Iterator[Page]:
+        """Predict the doctags of the valid pages, yielding every page in order."""
+        pages = []
+        for page in page_batch:
+            pages.append(page)
+            if len(pages) == self.batch_size:
+                yield from self._predict(conv_res, pages)
+                pages = []
+        yield from self._predict(conv_res, pages)
+
+    def _predict(self, conv_res: ConversionResult, pages: list[Page]) -> list[Page]:
+        valid_pages = [page for page in pages if page._backend is not None and page._backend.is_valid()]
+        if not valid_pages:
+            return pages
+
+        with TimeRecorder(conv_res, "vlm"):
+            images = [page.get_image(scale=2.0).convert("RGB") for page in valid_pages]
+            messages = [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": "This is a page from a document."},
+                        {"type": "image"},
+                        {"type": "text", "text": self.model.param_question},
+                    ],
+                }
+            ]
+            prompt = self.model.processor.apply_chat_template(messages, add_generation_prompt=False)
+            inputs = self.model.processor(
+                text=[prompt] * len(images), images=[[image] for image in images], padding=True, return_tensors="pt"
+            )
+            inputs = {key: value.to(self.model.device) for key, value in inputs.items()}
+
+            start = time.perf_counter()
+            generated_ids = self.model.vlm_model.generate(**inputs, max_new_tokens=4096, use_cache=True)
+            logger.debug(f"Generated {len(valid_pages)} pages in {time.perf_counter() - start:.2f} seconds")
+
+            # Pages that finish early are padded up to the longest page, so cut each one after its end of sequence token
+            rows = []
+            for row in generated_ids[:, inputs["input_ids"].shape[1] :].tolist():
+                end = next((i + 1 for i, token_id in enumerate(row) if token_id in self.eos_token_ids), len(row))
+                rows.append(row[:end])
+            for page, page_tags in zip(valid_pages, self.model.processor.batch_decode(rows, skip_special_tokens=False), strict=True):
+                page.predictions.vlm_response = VlmPrediction(text=page_tags)
+        return pages
+
+
+class BatchedVlmPipeline(VlmPipeline):
+    """VLM pipeline generating the pages of each page batch in batches of VLM_BATCH_SIZE, instead of one at a time."""
+
+    def __init__(self, pipeline_options: VlmPipelineOptions):
+        """Initialize."""
+        super().__init__(pipeline_options)
+        # MLX and API models keep generating one page at a time
+        if VLM_BATCH_SIZE > 1:
+            self.build_pipe = [BatchedVlmModel(model) if type(model) is HuggingFaceVlmModel else model for model in self.build_pipe]
@@ -0,0 +1,87 @@
+import logging
+import multiprocessing
+import sys
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from metadata_extraction_demo.constants import CONVERSION_PROFILE
+
+if TYPE_CHECKING:
+    from docling.datamodel.base_models import InputFormat
+    from docling.document_converter import DocumentConverter
+
+logger = logging.getLogger(__name__)
+
+# Converter of the worker process, built once when the worker starts
+_worker_converter: "DocumentConverter" = None
+
+
+def _init_worker(profile: str):
+    """Load the VLM in the worker process."""
+    global _worker_converter
+    from metadata_extraction_demo.convert import build_local_docling_converter
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+    _worker_converter = build_local_docling_converter(ocr_engine="vlm", profile=profile)
+
+
+def _initialize_pipeline(format: "InputFormat"):
+    """Initialize the VLM pipeline in the worker process."""
+    _worker_converter.initialize_pipeline(format)
+
+
+def _convert(source: str, page_range: tuple[int, int], kwargs: dict) -> str:
+    """Convert a file in the worker process, returning the document as JSON without its page images."""
+    from metadata_extraction_demo.utils import drop_page_images
+
+    conversion_result = _worker_converter.convert(source, page_range=page_range, **kwargs)
+    return drop_page_images(conversion_result.document).model_dump_json()
+
+
+class VlmWorkerConverter:
+    """Converter running the VLM pipeline in a dedicated worker process, so model inference never blocks the app process."""
+
+    def __init__(self, profile: str = CONVERSION_PROFILE):
+        """Initialize."""
+        self.profile = profile
+        self._lock = threading.Lock()
+        self._start_executor()
+
+    def _start_executor(self):
+        """Start the worker process pool."""
+        # A single spawned worker keeps one copy of the model and runs one conversion at a time
+        self.executor = ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker, initargs=(self.profile,)
+        )
+        self._shutdown = weakref.finalize(self, self.executor.shutdown, wait=False)
+
+    def _submit(self, fn, *args):
+        """Run a function in the worker, restarting the worker once if it died, e.g. killed for running out of memory."""
+        executor = self.executor
+        try:
+            return executor.submit(fn, *args).result()
+        except BrokenProcessPool:
+            with self._lock:
+                # Concurrent callers all see the same broken pool, so only the first one replaces it
+                if self.executor is executor:
+                    logger.warning("VLM worker process died, restarting it")
+                    self._shutdown()
+                    self._start_executor()
+            return self.executor.submit(fn, *args).result()
+
+    def initialize_pipeline(self, format: "InputFormat"):
+        """Start the worker and load the model."""
+        self._submit(_initialize_pipeline, format)
+
+    def convert(self, source, page_range: tuple[int, int] = (1, sys.maxsize), **kwargs):
+        """Convert a file in the worker process."""
+        from docling_core.types.doc.document import DoclingDocument
+
+        from metadata_extraction_demo.docling_server import PseudoConversionResult
+
+        document_json = self._submit(_convert, str(Path(source)), page_range, kwargs)
+        return PseudoConversionResult(document=DoclingDocument.model_validate_json(document_json))
@@ -0,0 +1,178 @@
+import os
+
+import pytest
+
+from metadata_extraction_demo import cache
+from metadata_extraction_demo.cache import ConversionCache, ResponseCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replace the clock of the cache module with one that only moves when told to."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_response_cache_round_trip():
+    response_cache = ResponseCache(max_size=4, ttl=60, path=None)
+    key = response_cache.key({"model": "m", "messages": [{"role": "user", "content": "hi"}]})
+
+    assert response_cache.get(key) is None
+    response_cache.put(key, "m", '{"a": 1}')
+    assert response_cache.get(key) == '{"a": 1}'
+    assert response_cache.stats() == {"hits": 1, "misses": 1, "evictions": 0, "expirations": 0, "size": 1}
+
+
+def test_response_cache_key_ignores_dict_order():
+    response_cache = ResponseCache(path=None)
+    assert response_cache.key({"model": "m", "temperature": 0}) == response_cache.key({"temperature": 0, "model": "m"})
+    assert response_cache.key({"model": "m"}) != response_cache.key({"model": "n"})
+
+
+def test_response_cache_expires_entries(clock):
+    response_cache = ResponseCache(max_size=4, ttl=60, path=None)
+    response_cache.put("key", "m", "value")
+
+    clock[0] += 59
+    assert response_cache.get("key") == "value"
+    clock[0] += 2
+    assert response_cache.get("key") is None
+    assert response_cache.stats()["expirations"] == 1
+    assert response_cache.stats()["size"] == 0
+
+
+def test_response_cache_evicts_least_recently_used():
+    response_cache = ResponseCache(max_size=2, ttl=60, path=None)
+    response_cache.put("a", "m", "1")
+    response_cache.put("b", "m", "2")
+    # Reading "a" makes "b" the least recently used entry
+    assert response_cache.get("a") == "1"
+    response_cache.put("c", "m", "3")
+
+    assert response_cache.get("b") is None
+    assert response_cache.get("a") == "1"
+    assert response_cache.get("c") == "3"
+    assert response_cache.stats()["evictions"] == 1
+
+
+def test_response_cache_reloads_from_sqlite(tmp_path):
+    path = tmp_path / "responses.sqlite"
+    ResponseCache(ttl=60, path=str(path)).put("key", "m", '{"a": 1}')
+
+    reloaded = ResponseCache(ttl=60, path=str(path))
+    assert reloaded.get("key") == '{"a": 1}'
+
+
+def test_response_cache_expires_reloaded_entries(tmp_path, clock):
+    path = tmp_path / "responses.sqlite"
+    ResponseCache(ttl=60, path=str(path)).put("key", "m", "value")
+
+    clock[0] += 61
+    reloaded = ResponseCache(ttl=60, path=str(path))
+    assert reloaded.get("key") is None
+    # The expired entry is deleted from disk too
+    assert ResponseCache(ttl=3600, path=str(path)).get("key") is None
+
+
+def test_response_cache_invalidates_by_key_and_model(tmp_path):
+    path = tmp_path / "responses.sqlite"
+    response_cache = ResponseCache(ttl=60, path=str(path))
+    response_cache.put("a", "m1", "1")
+    response_cache.put("b", "m1", "2")
+    response_cache.put("c", "m2", "3")
+
+    response_cache.invalidate(key="c")
+    assert response_cache.get("c") is None
+    response_cache.invalidate(model="m1")
+    assert response_cache.get("a") is None
+    assert response_cache.get("b") is None
+
+    reloaded = ResponseCache(ttl=60, path=str(path))
+    assert [reloaded.get(key) for key in ("a", "b", "c")] == [None, None, None]
+
+
+def test_conversion_cache_pages_round_trip(tmp_path):
+    conversion_cache = ConversionCache(directory=tmp_path, max_bytes=1_000_000)
+    source = tmp_path / "source.pdf"
+    source.write_bytes(b"%PDF-1.4 content")
+    key = conversion_cache.key(source, namespace="easyocr")
+
+    assert conversion_cache.get_pages(key) is None
+    conversion_cache.put_pages(key, ["page 1", "page 2"])
+    assert conversion_cache.get_pages(key) == ["page 1", "page 2"]
+    assert conversion_cache.stats() == {"hits": 1, "misses": 1, "evictions": 0}
+
+
+def test_conversion_cache_key_depends_on_content_and_namespace(tmp_path):
+    conversion_cache = ConversionCache(directory=tmp_path / "cache")
+    source_1 = tmp_path / "a.pdf"
+    source_2 = tmp_path / "b.pdf"
+    source_1.write_bytes(b"same")
+    source_2.write_bytes(b"same")
+
+    assert conversion_cache.key(source_1, namespace="x") == conversion_cache.key(source_2, namespace="x")
+    assert conversion_cache.key(source_1, namespace="x") != conversion_cache.key(source_1, namespace="y")
+    source_2.write_bytes(b"different")
+    assert conversion_cache.key(source_1, namespace="x") != conversion_cache.key(source_2, namespace="x")
+
+
+def test_conversion_cache_evicts_least_recently_used(tmp_path):
+    page = "x" * 100
+    conversion_cache = ConversionCache(directory=tmp_path, max_bytes=250)
+    conversion_cache.put_pages("old", [page])
+    conversion_cache.put_pages("new", [page])
+    os.utime(tmp_path / "old.pages.json", (1, 1))
+    os.utime(tmp_path / "new.pages.json", (2, 2))
+
+    conversion_cache.put_pages("newest", [page])
+
+    assert conversion_cache.get_pages("old") is None
+    assert conversion_cache.get_pages("new") == [page]
+    assert conversion_cache.get_pages("newest") == [page]
+    assert conversion_cache.stats()["evictions"] == 1
+
+
+def test_conversion_cache_discards_unreadable_entries(tmp_path):
+    conversion_cache = ConversionCache(directory=tmp_path)
+    (tmp_path / "broken.pages.json").write_text('["truncated')
+
+    assert conversion_cache.get_pages("broken") is None
+    assert not (tmp_path / "broken.pages.json").exists()
+
+
+def test_conversion_cache_creates_its_directory_on_first_put(tmp_path):
+    directory = tmp_path / "cache" / "conversions"
+    conversion_cache = ConversionCache(directory=directory)
+    assert conversion_cache.get_pages("missing") is None
+    conversion_cache.evict()
+    assert not directory.exists()
+
+    conversion_cache.put_pages("key", ["page 1"])
+    assert conversion_cache.get_pages("key") == ["page 1"]
+
+
+def test_response_cache_evicts_from_sqlite(tmp_path):
+    path = tmp_path / "responses.sqlite"
+    response_cache = ResponseCache(max_size=2, ttl=60, path=str(path))
+    response_cache.put("a", "m", "1")
+    response_cache.put("b", "m", "2")
+    response_cache.put("c", "m", "3")
+
+    reloaded = ResponseCache(max_size=2, ttl=60, path=str(path))
+    assert [reloaded.get(key) for key in ("a", "b", "c")] == [None, "2", "3"]
+
+
+def test_response_cache_prunes_sqlite_on_startup(tmp_path, clock):
+    path = tmp_path / "responses.sqlite"
+    response_cache = ResponseCache(max_size=4, ttl=60, path=str(path))
+    response_cache.put("expired", "m", "0")
+    clock[0] += 50
+    for key in ("a", "b", "c"):
+        clock[0] += 1
+        response_cache.put(key, "m", key)
+
+    clock[0] += 20
+    reloaded = ResponseCache(max_size=2, ttl=60, path=str(path))
+    assert reloaded.stats() == {"hits": 0, "misses": 0, "evictions": 1, "expirations": 1, "size": 0}
+    assert [reloaded.get(key) for key in ("expired", "a", "b", "c")] == [None, None, "b", "c"]
@@ -0,0 +1,40 @@
+import pytest
+
+from metadata_extraction_demo.chunking import merge_results
+
+RESULTS = [
+    {"title": "Contract", "vendor": None, "amount": 100},
+    {"title": "Amendment", "vendor": "Acme", "amount": 200},
+    {"title": "Amendment", "vendor": None, "amount": None, "signed": True},
+]
+
+
+def test_merge_results_first():
+    assert merge_results(RESULTS, rule="first") == {"title": "Contract", "vendor": "Acme", "amount": 100, "signed": True}
+
+
+def test_merge_results_last():
+    assert merge_results(RESULTS, rule="last") == {"title": "Amendment", "vendor": "Acme", "amount": 200, "signed": True}
+
+
+def test_merge_results_most_common():
+    assert merge_results(RESULTS, rule="most_common")["title"] == "Amendment"
+
+
+def test_merge_results_most_common_breaks_ties_by_document_order():
+    assert merge_results([{"a": 1}, {"a": 2}], rule="most_common") == {"a": 1}
+
+
+def test_merge_results_most_common_compares_nested_values():
+    results = [{"parties": ["b", "a"]}, {"parties": {"x": 1, "y": 2}}, {"parties": {"y": 2, "x": 1}}]
+    assert merge_results(results, rule="most_common") == {"parties": {"x": 1, "y": 2}}
+
+
+def test_merge_results_keeps_fields_without_values():
+    assert merge_results([{"a": None}, {"a": None, "b": None}]) == {"a": None, "b": None}
+    assert merge_results([]) == {}
+
+
+def test_merge_results_rejects_unknown_rules():
+    with pytest.raises(ValueError):
+        merge_results(RESULTS, rule="average")
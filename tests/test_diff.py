@@ -0,0 +1,52 @@
+import pytest
+
+from metadata_extraction_demo.diff import diff_texts, error_rates
+
+
+def reconstruct(spans: list[tuple[str, str | None]]) -> tuple[str, str]:
+    """Rebuild both texts from diff spans."""
+    text_1 = "".join(text for text, label in spans if label != "+")
+    text_2 = "".join(text for text, label in spans if label != "-")
+    return text_1, text_2
+
+
+@pytest.mark.parametrize(
+    "text_1, text_2",
+    [
+        ("", ""),
+        ("same\ntext\n", "same\ntext\n"),
+        ("", "only in the second\n"),
+        ("only in the first\n", ""),
+        ("The quick brown fox\njumps over\nthe lazy dog\n", "The quick red fox\njumps over\nthe lazy dog!\n"),
+        ("a\nb\nc\nd\n", "d\nc\nb\na\n"),
+        ("header\n" + "line\n" * 50 + "footer", "header\n" + "line\n" * 49 + "changed line\nfooter\n"),
+        ("no trailing newline", "no trailing newline\n"),
+    ],
+)
+def test_diff_texts_round_trips(text_1, text_2):
+    assert reconstruct(diff_texts(text_1, text_2)) == (text_1, text_2)
+
+
+def test_diff_texts_round_trips_without_word_refinement():
+    text_1 = "one two three\nfour five\n"
+    text_2 = "one 2 three\nfour six\n"
+    assert reconstruct(diff_texts(text_1, text_2, max_chars=0)) == (text_1, text_2)
+    assert reconstruct(diff_texts(text_1, text_2, max_word_tokens=0)) == (text_1, text_2)
+
+
+def test_diff_texts_refines_changed_lines_by_word():
+    spans = diff_texts("The quick brown fox\n", "The quick red fox\n")
+    assert ("brown", "-") in spans
+    assert ("red", "+") in spans
+    assert spans[0] == ("The quick ", None)
+
+
+def test_diff_texts_coalesces_spans():
+    spans = diff_texts("a\nb\nc\n", "a\nb\nc\n")
+    assert spans == [("a\nb\nc\n", None)]
+
+
+def test_error_rates():
+    assert error_rates("same text", "same text") == {"cer": 0.0, "wer": 0.0}
+    rates = error_rates("one two three four", "one two tree four")
+    assert 0 < rates["cer"] < rates["wer"]
@@ -0,0 +1,63 @@
+import pytest
+from PyPDF2 import PdfWriter
+
+from metadata_extraction_demo.docling_server import DOCTAG_END, DOCTAG_START, PAGE_BREAK, load_page_doctags, split_doctags_pages
+from metadata_extraction_demo.utils import iter_blank_page_images
+
+
+def test_split_doctags_pages():
+    doctags = f"{DOCTAG_START}<text>one</text>{PAGE_BREAK}<text>two</text>{PAGE_BREAK}<text>three</text>{DOCTAG_END}"
+    assert split_doctags_pages(doctags, 3) == [
+        f"{DOCTAG_START}<text>one</text>{DOCTAG_END}",
+        f"{DOCTAG_START}<text>two</text>{DOCTAG_END}",
+        f"{DOCTAG_START}<text>three</text>{DOCTAG_END}",
+    ]
+
+
+def test_split_doctags_pages_keeps_single_pages_as_is():
+    doctags = f"{DOCTAG_START}<text>one</text>{DOCTAG_END}\n"
+    assert split_doctags_pages(doctags, 1) == [doctags]
+
+
+def test_split_doctags_pages_ignores_surrounding_whitespace():
+    doctags = f"\n{DOCTAG_START}<text>one</text>{PAGE_BREAK}{DOCTAG_END}\n"
+    assert split_doctags_pages(doctags, 2) == [f"{DOCTAG_START}<text>one</text>{DOCTAG_END}", f"{DOCTAG_START}{DOCTAG_END}"]
+
+
+def test_split_doctags_pages_rejects_page_count_mismatch():
+    with pytest.raises(ValueError):
+        split_doctags_pages(f"{DOCTAG_START}<text>one</text>{DOCTAG_END}", 2)
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    writer = PdfWriter()
+    writer.add_blank_page(width=612, height=792)
+    writer.add_blank_page(width=612, height=792)
+    writer.pages[1].rotate(90)
+    path = tmp_path / "blank.pdf"
+    with open(path, "wb") as f:
+        writer.write(f)
+    return path
+
+
+def test_iter_blank_page_images_sizes_pages_in_points(pdf_path):
+    assert [image.size for image in iter_blank_page_images(pdf_path)] == [(612, 792), (792, 612)]
+    assert [image.size for image in iter_blank_page_images(pdf_path, first_page=2, last_page=5)] == [(792, 612)]
+
+
+def test_load_page_doctags(pdf_path):
+    page_doctags = [
+        f"{DOCTAG_START}<text><loc_0><loc_0><loc_250><loc_250>one</text>{DOCTAG_END}",
+        f"{DOCTAG_START}<picture><loc_0><loc_0><loc_500><loc_500></picture>{DOCTAG_END}",
+    ]
+    document = load_page_doctags(iter(page_doctags), iter_blank_page_images(pdf_path), document_name="blank.pdf")
+    assert [(page.size.width, page.size.height) for page in document.pages.values()] == [(612, 792), (792, 612)]
+    assert all(page.image is None for page in document.pages.values())
+    assert document.texts[0].prov[0].bbox.r == 306
+    assert document.pictures[0].image is None
+
+
+def test_load_page_doctags_rejects_page_count_mismatch(pdf_path):
+    with pytest.raises(ValueError):
+        load_page_doctags([f"{DOCTAG_START}{DOCTAG_END}"], iter_blank_page_images(pdf_path), document_name="blank.pdf")
@@ -0,0 +1,11 @@
+import pytest
+
+from metadata_extraction_demo.constants import IMPORT_TIME_BUDGET
+from metadata_extraction_demo.import_time import MODULES, measure_import
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_startup_imports_stay_within_budget(module):
+    result = measure_import(module, repeat=1)
+    assert result["deferred_imported"] == []
+    assert result["seconds"] <= IMPORT_TIME_BUDGET
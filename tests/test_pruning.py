@@ -0,0 +1,74 @@
+from enum import Enum
+
+from pydantic import BaseModel, Field
+
+from metadata_extraction_demo.pruning import BM25, estimate_tokens, prune_text, schema_terms, tokenize
+
+
+class ContractType(str, Enum):
+    LEASE = "lease"
+    EMPLOYMENT = "employment"
+
+
+class Metadata(BaseModel):
+    effective_date: str = Field(..., description="Date the agreement takes effect")
+    contract_type: ContractType
+
+
+FILLER = "The weather was pleasant and the garden was green. " * 8
+
+TEXT = "\n\n".join(
+    [
+        f"# Preamble\n\n{FILLER}",
+        "## Term\n\nThe agreement takes effect on the effective date of 1 March 2024.",
+        f"## Weather\n\n{FILLER}",
+        "## Premises\n\nThis lease covers the premises at 12 Main Street.",
+        f"## Garden\n\n{FILLER}",
+    ]
+)
+
+
+def test_tokenize():
+    assert tokenize("Effective-Date: 1 March, 2024") == ["effective", "date", "1", "march", "2024"]
+
+
+def test_schema_terms_include_field_names_descriptions_and_enum_options():
+    terms = schema_terms(Metadata)
+    assert {"effective", "date", "agreement", "takes", "effect"} <= set(terms)
+    assert {"contract", "type", "lease", "employment"} <= set(terms)
+
+
+def test_bm25_ranks_matching_documents_first():
+    index = BM25([["garden", "green"], ["lease", "premises"], []])
+    scores = index.scores(["lease"])
+    assert scores[1] > scores[0] == scores[2] == 0
+
+
+def test_prune_text_keeps_relevant_sections_in_document_order():
+    pruned_text, stats = prune_text(TEXT, Metadata, top_k=2, token_budget=1000)
+    assert pruned_text.startswith("## Term")
+    assert pruned_text.index("## Term") < pruned_text.index("## Premises")
+    assert "## Weather" not in pruned_text and "# Preamble" not in pruned_text
+    assert stats["sections_total"] == 5
+    assert stats["sections_kept"] == 2
+    assert stats["tokens_saved"] == stats["tokens_before"] - stats["tokens_after"]
+
+
+def test_prune_text_respects_the_token_budget():
+    budget = estimate_tokens("## Term\n\nThe agreement takes effect on the effective date of 1 March 2024.") + 5
+    pruned_text, stats = prune_text(TEXT, Metadata, top_k=5, token_budget=budget)
+    assert stats["tokens_after"] <= budget
+    assert pruned_text.startswith("## Term")
+
+
+def test_prune_text_keeps_the_best_section_even_over_budget():
+    pruned_text, stats = prune_text(TEXT, Metadata, top_k=5, token_budget=1)
+    assert stats["sections_kept"] == 1
+    assert pruned_text.startswith("## Term")
+
+
+def test_prune_text_splits_long_sections():
+    long_section = "# Long\n\n" + "\n\n".join([FILLER] * 4 + ["The lease premises are listed here."])
+    pruned_text, stats = prune_text(long_section, Metadata, top_k=1, token_budget=1000, section_max_chars=len(FILLER) + 10)
+    assert stats["sections_total"] > 1
+    assert pruned_text == "The lease premises are listed here."
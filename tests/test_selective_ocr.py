@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+
+from PyPDF2 import PdfWriter
+
+from metadata_extraction_demo import convert, selective_ocr
+from metadata_extraction_demo.convert import ConverterPool
+from metadata_extraction_demo.docling_server import DOCTAG_END, DOCTAG_START, PAGE_BREAK
+from metadata_extraction_demo.selective_ocr import SelectiveOcrConverter, page_needs_ocr, page_runs
+
+BODY_TEXT = "This Agreement is entered into by and between the parties named below. " * 40
+BATES_STAMP = "CONFIDENTIAL - SUBJECT TO PROTECTIVE ORDER  ACME-000123"
+
+
+def test_page_needs_ocr_for_missing_or_garbled_text():
+    assert page_needs_ocr("")
+    assert page_needs_ocr("Page 1")
+    assert page_needs_ocr("(cid:12)(cid:34)(cid:56) " * 20)
+
+
+def test_page_needs_ocr_skips_born_digital_pages():
+    assert not page_needs_ocr(BODY_TEXT)
+    assert not page_needs_ocr(BATES_STAMP, image_coverage=0.0)
+
+
+def test_page_needs_ocr_for_scans_with_a_clean_stamp():
+    assert page_needs_ocr(BATES_STAMP, image_coverage=1.0)
+    # A scan that already carries an OCR text layer is dense enough to use as is
+    assert not page_needs_ocr(BODY_TEXT, image_coverage=1.0)
+
+
+def test_page_runs():
+    assert page_runs([True, True, False, True, False, False]) == [(True, 1, 2), (False, 3, 3), (True, 4, 4), (False, 5, 6)]
+
+
+def test_page_runs_offsets_page_numbers():
+    assert page_runs([False, False, True], first_page=5) == [(False, 5, 6), (True, 7, 7)]
+
+
+def test_page_runs_single_run_and_empty():
+    assert page_runs([True] * 3) == [(True, 1, 3)]
+    assert page_runs([]) == []
+
+
+class FakeConverter:
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = []
+
+    def initialize_pipeline(self, format):
+        pass
+
+    def convert(self, source, page_range):
+        self.calls.append(page_range)
+        pages = [
+            f"<text><loc_0><loc_0><loc_500><loc_500>{self.name} {page_no}</text>" for page_no in range(page_range[0], page_range[1] + 1)
+        ]
+        document = SimpleNamespace(export_to_doctags=lambda: DOCTAG_START + PAGE_BREAK.join(pages) + DOCTAG_END)
+        return SimpleNamespace(document=document)
+
+
+def test_selective_ocr_converter_merges_runs_in_page_order(tmp_path, monkeypatch):
+    writer = PdfWriter()
+    for _ in range(4):
+        writer.add_blank_page(width=612, height=792)
+    path = tmp_path / "mixed.pdf"
+    with open(path, "wb") as f:
+        writer.write(f)
+    monkeypatch.setattr(selective_ocr, "classify_pages", lambda path, page_range: [True, False, False, True])
+
+    ocr_converter, text_converter = FakeConverter("ocr"), FakeConverter("text")
+    document = SelectiveOcrConverter(ocr_converter=ocr_converter, text_converter=text_converter).convert(path).document
+
+    assert ocr_converter.calls == [(1, 1), (4, 4)]
+    assert text_converter.calls == [(2, 3)]
+    assert [text.text for text in document.texts] == ["ocr 1", "text 2", "text 3", "ocr 4"]
+    assert [document.pages[page_no].size.width for page_no in range(1, 5)] == [612] * 4
+
+
+def test_converter_pool_pools_the_selective_ocr_converters(monkeypatch):
+    built = []
+
+    def build_document_converter(method, selective_ocr=False, ocr_converter=None, text_converter=None, **kwargs):
+        built.append(method)
+        if selective_ocr:
+            return SelectiveOcrConverter(ocr_converter=ocr_converter, text_converter=text_converter)
+        return FakeConverter(method)
+
+    monkeypatch.setattr(convert, "build_document_converter", build_document_converter)
+    pool = ConverterPool(max_size=4)
+    easyocr_converter = pool.get(method="easyocr", selective_ocr=True)
+    ocrmac_converter = pool.get(method="ocrmac", selective_ocr=True)
+
+    assert built == ["easyocr", "text", "easyocr", "ocrmac", "ocrmac"]
+    assert easyocr_converter.text_converter is ocrmac_converter.text_converter
+    assert len(pool._converters) == 4
@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+
+import torch
+from PIL import Image
+
+from metadata_extraction_demo.vlm_batch import BatchedVlmModel
+
+EOS = 2
+PAD = 0
+PROMPT_LENGTH = 3
+
+
+class FakeProcessor:
+    def __init__(self):
+        self.tokenizer = SimpleNamespace(padding_side="right")
+        self.batch_sizes = []
+
+    def apply_chat_template(self, messages, add_generation_prompt):
+        return "prompt"
+
+    def __call__(self, text, images, padding, return_tensors):
+        self.batch_sizes.append(len(text))
+        return {"input_ids": torch.ones((len(text), PROMPT_LENGTH), dtype=torch.long)}
+
+    def batch_decode(self, rows, skip_special_tokens):
+        return [" ".join(map(str, row)) for row in rows]
+
+
+class FakeVlm:
+    generation_config = SimpleNamespace(eos_token_id=[EOS])
+
+    def __init__(self, outputs: list[list[int]]):
+        self.outputs = iter(outputs)
+
+    def generate(self, input_ids, **kwargs):
+        generated = torch.tensor([next(self.outputs) for _ in range(len(input_ids))])
+        return torch.cat([input_ids, generated], dim=1)
+
+
+def make_page(valid: bool = True):
+    backend = SimpleNamespace(is_valid=lambda: valid)
+    return SimpleNamespace(
+        _backend=backend, get_image=lambda scale: Image.new("L", (10, 10)), predictions=SimpleNamespace(vlm_response=None)
+    )
+
+
+def test_batched_vlm_model_generates_pages_together():
+    processor = FakeProcessor()
+    model = SimpleNamespace(
+        processor=processor, vlm_model=FakeVlm([[5, 6, EOS], [7, EOS, PAD], [8, 9, 10]]), param_question="Convert.", device="cpu"
+    )
+    pages = [make_page(), make_page(valid=False), make_page(), make_page()]
+
+    batched_model = BatchedVlmModel(model, batch_size=2)
+    assert list(batched_model(None, pages)) == pages
+
+    assert processor.tokenizer.padding_side == "left"
+    assert processor.batch_sizes == [1, 2]
+    assert [page.predictions.vlm_response and page.predictions.vlm_response.text for page in pages] == [
+        "5 6 2",
+        None,
+        "7 2",
+        "8 9 10",
+    ]
@@ -0,0 +1,29 @@
+import multiprocessing
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from metadata_extraction_demo.vlm_worker import VlmWorkerConverter
+
+
+class LightVlmWorkerConverter(VlmWorkerConverter):
+    """Worker converter that starts its workers without loading the VLM."""
+
+    def _start_executor(self):
+        self.executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        self._shutdown = weakref.finalize(self, self.executor.shutdown, wait=False)
+
+
+def test_vlm_worker_converter_restarts_a_dead_worker():
+    converter = LightVlmWorkerConverter()
+    worker_pid = converter._submit(os.getpid)
+
+    # The retry dies too, which leaves the pool broken until the next call
+    with pytest.raises(BrokenProcessPool):
+        converter._submit(os._exit, 1)
+
+    assert converter._submit(os.getpid) not in (worker_pid, os.getpid())
+    converter.executor.shutdown()